@@ -0,0 +1,148 @@
+"""One-box test of the detection fan-out (main.py --publish / --subscribe).
+
+Runs a publisher (with a deliberately skewed clock) in this process, a simulated
+Intiface server with one toy per subscriber (mock_intiface.py), and N subscriber
+processes, each a DuckHaptics with no templates and one player. Synthetic +1 and
+intermission events are published at a fixed rate; every subscriber reports
+what it received, its clock offset estimate (which should match the skew) and
+the event age after offset compensation.
+
+Usage:
+    python fanout_test.py --subscribers 8 --events 40 --rate 10 --skew 3.5 --json fanout.json
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import itertools
+import json
+import multiprocessing
+import sys
+import time
+
+from main import DUCK_COLORS, Detection, DuckHaptics, EventPublisher, EventSubscriber
+from mock_intiface import MockIntifaceServer, ServerThread
+
+
+def subscriber_process(index, address, intiface, color, stop, results):
+    asyncio.run(_subscriber(index, address, intiface, color, stop, results))
+
+
+async def _subscriber(index, address, intiface, color, stop, results):
+    game = DuckHaptics(defer_templates=True)
+    with contextlib.redirect_stdout(io.StringIO()):
+        game.set_language('en')
+        game.intiface_address = intiface
+        game.scan_time = 0.2
+        await game.connect_intiface()
+        await game.setup_players([(color, index)])
+        subscriber = EventSubscriber(address, game.handle_detection,
+                                     on_hello=lambda hello: game.set_event_profiles(hello.get('profiles', [])),
+                                     metrics=game.metrics)
+        task = asyncio.create_task(subscriber.run())
+        while not stop.is_set():
+            await asyncio.sleep(0.05)
+        subscriber.close()
+        task.cancel()
+        game.running = False
+        for t in game.vibration_tasks:
+            t.cancel()
+        await game.dispatcher.drain()
+        await game.client.disconnect()
+    stages = game.metrics.summary()
+    results.put({
+        'index': index,
+        'color': color,
+        **subscriber.stats(),
+        'event_age_ms': {k: stages.get('event_age', {}).get(k + '_ms', 0.0) for k in ('p50', 'p99', 'max')},
+        'intensity': game.players[0].intensity,
+        'commands': sum(st['sent'] for st in game.dispatcher.stats().values()),
+        'opencv_loaded': 'cv2' in sys.modules,
+    })
+
+
+async def publish(publisher, subscribers, events, rate, skew):
+    # Wait until every subscriber is connected and has a clock estimate
+    deadline = time.time() + 30.0
+    while len(publisher.subscribers) < subscribers and time.time() < deadline:
+        await asyncio.sleep(0.05)
+    await asyncio.sleep(1.0)
+    colors = itertools.cycle(list(DUCK_COLORS))
+    for n in range(events):
+        if n % 10 == 9:
+            detection = Detection(0.0, intermission=True, event='intermission', template='intermission')
+        else:
+            detection = Detection(0.0, color=next(colors), event='plus_one', template='plus_one')
+        # Captured "just now" on the publisher's (skewed) clock
+        detection.timestamp = time.time() + skew
+        publisher.publish(detection)
+        await asyncio.sleep(1.0 / rate)
+    await asyncio.sleep(0.5)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Publisher + N subscriber processes + mock Intiface on one machine.")
+    parser.add_argument('--subscribers', type=int, default=4)
+    parser.add_argument('--events', type=int, default=30)
+    parser.add_argument('--rate', type=float, default=10.0, help="events per second")
+    parser.add_argument('--skew', type=float, default=3.5, help="seconds the publisher's clock is ahead")
+    parser.add_argument('--max-offset-error', type=float, default=5.0, help="fail if an offset estimate is off by more (ms)")
+    parser.add_argument('--json', help="write the results as JSON to this file")
+    args = parser.parse_args()
+
+    thread = ServerThread(MockIntifaceServer(args.subscribers, port=0, latency=0.005))
+    server = thread.start()
+    loop = asyncio.new_event_loop()
+    publisher = loop.run_until_complete(
+        EventPublisher('127.0.0.1', 0, clock=lambda: time.time() + args.skew).start())
+    address = f"127.0.0.1:{publisher.port}"
+
+    ctx = multiprocessing.get_context('spawn')
+    stop = ctx.Event()
+    results = ctx.Queue()
+    colors = list(DUCK_COLORS)
+    processes = [ctx.Process(target=subscriber_process,
+                             args=(i, address, server.address, colors[i % len(colors)], stop, results))
+                 for i in range(args.subscribers)]
+    for p in processes:
+        p.start()
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            loop.run_until_complete(publish(publisher, args.subscribers, args.events, args.rate, args.skew))
+        connected = len(publisher.subscribers)
+        stop.set()
+        reports = sorted((results.get(timeout=30) for _ in processes), key=lambda r: r['index'])
+    finally:
+        stop.set()
+        for p in processes:
+            p.join(timeout=10)
+        with contextlib.redirect_stdout(io.StringIO()):
+            loop.run_until_complete(publisher.close())
+        loop.close()
+        thread.stop()
+
+    failed = connected < args.subscribers
+    print(f"{connected}/{args.subscribers} subscribers connected, {args.events} events at {args.rate:g}/s, "
+          f"publisher clock {args.skew:+.3f} s")
+    for r in reports:
+        error_ms = (r['offset'] - args.skew) * 1000.0
+        age = r['event_age_ms']
+        problems = []
+        if r['received'] != args.events:
+            problems.append(f"received {r['received']}")
+        if abs(error_ms) > args.max_offset_error:
+            problems.append(f"offset error {error_ms:.1f} ms")
+        failed = failed or bool(problems)
+        r['offset_error_ms'] = error_ms
+        print(f"  #{r['index']} {r['color']:<7} received {r['received']} (stale {r['stale']}), offset error "
+              f"{error_ms:+.2f} ms (rtt {r['delay'] * 1000.0:.2f} ms), event age p50 {age['p50']:.2f} / "
+              f"p99 {age['p99']:.2f} ms, {r['commands']} commands, OpenCV loaded: {r['opencv_loaded']}"
+              + (f"  FAIL: {', '.join(problems)}" if problems else ""))
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as fh:
+            json.dump({'connected': connected, 'subscribers': reports}, fh, indent=2)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,148 @@
+"""Load test for the haptics side of DuckSense.
+
+Starts mock_intiface.py's simulated server (in its own thread, so its work does
+not load the event loop under test), connects DuckHaptics to it, assigns one
+player per simulated device through setup_players() and lets _vibration_loop
+and the dispatcher drive every device at full amplitude for a while. Reports,
+per device count: command throughput (target vs sent), errors and dropped
+levels, vibration tick lag, event-loop lag and command round trips.
+
+Usage:
+    python loadtest.py --devices 1,8,32 --duration 10 --latency 20 --jitter 10 --failure-rate 0.01
+    python loadtest.py --max-tick-lag 5 --max-loop-lag 5   # exit code 1 if a p99 exceeds the limit
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import statistics
+import sys
+
+from main import DUCK_COLORS, DuckHaptics
+from mock_intiface import MockIntifaceServer, ServerThread
+
+
+async def loop_lag_probe(metrics, interval=0.005):
+    # Oversleep of a short sleep = how long the loop was busy with something else
+    loop = asyncio.get_running_loop()
+    while True:
+        started = loop.time()
+        await asyncio.sleep(interval)
+        metrics.observe('loop_lag', max(0.0, loop.time() - started - interval))
+
+
+async def run_scenario(devices, args):
+    thread = ServerThread(MockIntifaceServer(devices, port=0, latency=args.latency / 1000.0,
+                                             jitter=args.jitter / 1000.0, failure_rate=args.failure_rate,
+                                             seed=args.seed))
+    server = thread.start()
+    game = DuckHaptics()
+    game.intiface_address = server.address
+    game.scan_time = 0.2
+    game.vibration_freq = args.freq
+    game.max_in_flight = args.max_in_flight
+    quiet = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+    probe = None
+    try:
+        with quiet:
+            if not await game.connect_intiface():
+                raise RuntimeError(f"could not connect to the mock server at {server.address}")
+            colors = list(DUCK_COLORS)
+            await game.setup_players([(colors[i % len(colors)], i) for i in range(devices)])
+            # Every player vibrates for the whole run, so every tick produces new levels
+            for player in game.players:
+                player.add_vibration_event(1.0, args.duration + 5.0)
+            probe = asyncio.create_task(loop_lag_probe(game.metrics))
+            await asyncio.sleep(args.duration)
+            game.running = False
+            for t in game.vibration_tasks + [probe]:
+                t.cancel()
+            await game.dispatcher.drain()
+            for player in game.players:
+                with contextlib.suppress(Exception):
+                    await player.stop_device()
+        return summarize(devices, game, server, args)
+    finally:
+        if probe is not None:
+            probe.cancel()
+        with contextlib.suppress(Exception):
+            await game.client.disconnect()
+        thread.stop()
+
+
+def summarize(devices, game, server, args):
+    dispatch = game.dispatcher.stats()
+    stages = game.metrics.summary()
+    sends = [st for name, st in stages.items() if name.startswith('send:')]
+    empty = {'p50_ms': 0.0, 'p99_ms': 0.0, 'max_ms': 0.0}
+    tick, lag = stages.get('tick_lag', empty), stages.get('loop_lag', empty)
+    served = server.stats().values()
+    return {
+        'devices': devices,
+        'duration_s': args.duration,
+        'target_per_s': sum(st['target_rate'] for st in dispatch.values()),
+        'sent_per_s': sum(st['achieved_rate'] for st in dispatch.values()),
+        'sent_per_device_per_s': statistics.mean(st['achieved_rate'] for st in dispatch.values()),
+        'errors': sum(st['errors'] for st in dispatch.values()),
+        'dropped': sum(st['dropped'] for st in dispatch.values()),
+        'skipped': sum(st['skipped'] for st in dispatch.values()),
+        'tick_lag_ms': {k: tick[k + '_ms'] for k in ('p50', 'p99', 'max')},
+        'loop_lag_ms': {k: lag[k + '_ms'] for k in ('p50', 'p99', 'max')},
+        'send_ms': {
+            'p50': statistics.median(st['p50_ms'] for st in sends) if sends else 0.0,
+            'p99_worst': max((st['p99_ms'] for st in sends), default=0.0),
+        },
+        'server_commands': sum(st['commands'] for st in served),
+        'server_failures': sum(st['failures'] for st in served),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the vibration loop and dispatcher against simulated devices.")
+    parser.add_argument('--devices', default='1,8,32', help="comma separated device counts (default 1,8,32)")
+    parser.add_argument('--duration', type=float, default=5.0, help="seconds per scenario (default 5)")
+    parser.add_argument('--latency', type=float, default=10.0, help="simulated command latency in ms (default 10)")
+    parser.add_argument('--jitter', type=float, default=5.0, help="± latency jitter in ms (default 5)")
+    parser.add_argument('--failure-rate', type=float, default=0.0, help="probability a command fails (0-1)")
+    parser.add_argument('--freq', type=float, default=7.0,
+                        help="vibration carrier in Hz; not a divisor of the update rate so levels keep changing (default 7)")
+    parser.add_argument('--max-in-flight', type=int, default=1, help="commands in flight per device (default 1)")
+    parser.add_argument('--max-tick-lag', type=float, help="fail if p99 tick lag exceeds this many ms")
+    parser.add_argument('--max-loop-lag', type=float, help="fail if p99 event-loop lag exceeds this many ms")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', help="write the results as JSON to this file")
+    parser.add_argument('--verbose', action='store_true', help="show the program's own console output")
+    args = parser.parse_args()
+
+    results = []
+    failed = False
+    for devices in [int(n) for n in args.devices.split(',') if n.strip()]:
+        result = asyncio.run(run_scenario(devices, args))
+        problems = []
+        if args.max_tick_lag is not None and result['tick_lag_ms']['p99'] > args.max_tick_lag:
+            problems.append(f"tick lag p99 {result['tick_lag_ms']['p99']:.1f} ms > {args.max_tick_lag} ms")
+        if args.max_loop_lag is not None and result['loop_lag_ms']['p99'] > args.max_loop_lag:
+            problems.append(f"loop lag p99 {result['loop_lag_ms']['p99']:.1f} ms > {args.max_loop_lag} ms")
+        result['problems'] = problems
+        failed = failed or bool(problems)
+        results.append(result)
+
+        tick, lag, send = result['tick_lag_ms'], result['loop_lag_ms'], result['send_ms']
+        print(f"{devices:>3} device(s): {result['sent_per_s']:.0f}/s sent of {result['target_per_s']:.0f}/s target "
+              f"({result['sent_per_device_per_s']:.1f}/s per device), errors {result['errors']}, "
+              f"dropped {result['dropped']}, skipped {result['skipped']}")
+        print(f"    tick lag p50 {tick['p50']:.2f} / p99 {tick['p99']:.2f} / max {tick['max']:.2f} ms; "
+              f"loop lag p50 {lag['p50']:.2f} / p99 {lag['p99']:.2f} / max {lag['max']:.2f} ms; "
+              f"send p50 {send['p50']:.1f} ms, worst p99 {send['p99_worst']:.1f} ms")
+        for problem in problems:
+            print(f"    FAIL: {problem}")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as fh:
+            json.dump(results, fh, indent=2)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
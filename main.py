@@ -1,13 +1,52 @@
 import asyncio
 import time
-import cv2
 import numpy as np
-import mss
-import keyboard
 import sys
 import os
 import math
-from buttplug.client import ButtplugClient, ButtplugClientWebsocketConnector, ButtplugClientDevice
+import threading
+import json
+import bisect
+import argparse
+import importlib
+import collections
+import struct
+import multiprocessing
+from multiprocessing import shared_memory
+
+class LazyModule:
+    """Stands in for a module that is imported on first attribute access (keeps startup fast)."""
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def _load(self):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return self._module
+
+    def __getattr__(self, attr):
+        value = getattr(self._load(), attr)
+        # Cache on the proxy so later lookups skip __getattr__ entirely
+        self.__dict__[attr] = value
+        return value
+
+cv2 = LazyModule('cv2')
+mss = LazyModule('mss')
+keyboard = LazyModule('keyboard')
+buttplug_client = LazyModule('buttplug.client')
+
+def preload_modules(modules=(buttplug_client, cv2, mss, keyboard)):
+    """Import the deferred modules in a daemon thread; returns the thread."""
+    def run():
+        for module in modules:
+            try:
+                module._load()
+            except Exception:
+                pass  # surfaces again, with its real traceback, on first use
+    thread = threading.Thread(target=run, name="preload", daemon=True)
+    thread.start()
+    return thread
 
 def resolve_path(relative_path):
     # When packaged (e.g., PyInstaller) resources are in a temporary folder via _MEIPASS
@@ -16,6 +55,110 @@ def resolve_path(relative_path):
     # Otherwise resolve relative to current working directory
     return os.path.join(os.path.abspath("."), relative_path)
 
+def user_data_path(filename):
+    # Writable files (calibration, profiles) live next to the executable/working dir, never in _MEIPASS
+    return os.path.join(os.path.abspath("."), filename)
+
+class LatencyHistogram:
+    """Fixed log-spaced latency buckets (10 us to ~7 s, factor sqrt(2)); observe() is O(log buckets)."""
+    BOUNDS = [1e-5 * 2 ** (i / 2) for i in range(40)]
+
+    def __init__(self):
+        self.counts = [0] * (len(self.BOUNDS) + 1)  # last bucket is +Inf
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(self.BOUNDS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, pct):
+        if not self.count:
+            return 0.0
+        rank = pct / 100.0 * self.count
+        seen = 0
+        for i, c in enumerate(self.counts):
+            seen += c
+            if seen >= rank and c:
+                return min(self.BOUNDS[i] if i < len(self.BOUNDS) else self.max, self.max)
+        return self.max
+
+class Metrics:
+    """Per-stage latency histograms; `end_to_end` is frame capture -> first haptic command (see mark_origin())."""
+    def __init__(self, clock=time.time):
+        self.clock = clock  # same clock as the capture timestamps passed to mark_origin()
+        self._lock = threading.Lock()
+        self.stages = {}
+        self._origin = None  # capture time of the newest detection that has not reached a device yet
+
+    def observe(self, stage, seconds):
+        with self._lock:
+            hist = self.stages.get(stage)
+            if hist is None:
+                hist = self.stages[stage] = LatencyHistogram()
+            hist.observe(seconds)
+
+    def mark_origin(self, capture_time):
+        self._origin = capture_time
+
+    def command_sent(self):
+        # Called by the dispatcher whenever it issues a command
+        origin, self._origin = self._origin, None
+        if origin is not None:
+            self.observe('end_to_end', self.clock() - origin)
+
+    def summary(self):
+        with self._lock:
+            return {stage: {
+                'count': h.count,
+                'mean_ms': h.total / h.count * 1000.0 if h.count else 0.0,
+                'p50_ms': h.percentile(50) * 1000.0,
+                'p90_ms': h.percentile(90) * 1000.0,
+                'p99_ms': h.percentile(99) * 1000.0,
+                'max_ms': h.max * 1000.0,
+            } for stage, h in sorted(self.stages.items())}
+
+    def prometheus(self):
+        lines = ["# HELP ducksense_stage_seconds Latency of DuckSense pipeline stages.",
+                 "# TYPE ducksense_stage_seconds histogram"]
+        with self._lock:
+            for stage, h in sorted(self.stages.items()):
+                label = stage.replace('\\', '\\\\').replace('"', '\\"')
+                cumulative = 0
+                for bound, c in zip(LatencyHistogram.BOUNDS, h.counts):
+                    cumulative += c
+                    lines.append(f'ducksense_stage_seconds_bucket{{stage="{label}",le="{bound:.6g}"}} {cumulative}')
+                lines.append(f'ducksense_stage_seconds_bucket{{stage="{label}",le="+Inf"}} {h.count}')
+                lines.append(f'ducksense_stage_seconds_sum{{stage="{label}"}} {h.total:.9f}')
+                lines.append(f'ducksense_stage_seconds_count{{stage="{label}"}} {h.count}')
+        return "\n".join(lines) + "\n"
+
+    def dump(self, directory):
+        """Write metrics.json and metrics.prom (replaced atomically) and append to metrics.csv."""
+        os.makedirs(directory, exist_ok=True)
+        now = time.time()
+        summary = self.summary()
+        _write_atomic(os.path.join(directory, 'metrics.json'), json.dumps({'time': now, 'stages': summary}, indent=2))
+        _write_atomic(os.path.join(directory, 'metrics.prom'), self.prometheus())
+        csv_path = os.path.join(directory, 'metrics.csv')
+        new_file = not os.path.exists(csv_path)
+        with open(csv_path, 'a', encoding='utf-8') as fh:
+            if new_file:
+                fh.write("time,stage,count,mean_ms,p50_ms,p90_ms,p99_ms,max_ms\n")
+            for stage, st in summary.items():
+                fh.write(f"{now:.3f},{stage},{st['count']},{st['mean_ms']:.4f},{st['p50_ms']:.4f},"
+                         f"{st['p90_ms']:.4f},{st['p99_ms']:.4f},{st['max_ms']:.4f}\n")
+
+def _write_atomic(path, text):
+    tmp = path + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as fh:
+        fh.write(text)
+    os.replace(tmp, path)
+
 # --- COLOR CONFIGURATION (HSV) ---
 # These ranges may require tuning depending on brightness/screen
 # Format: (Lower HSV), (Upper HSV)
@@ -28,33 +171,367 @@ DUCK_COLORS = {
     "green":  (np.array([40, 50, 50]),  np.array([80, 255, 255]))
 }
 
+class WaveformPreset:
+    """Envelope shape of a vibration event, sampled once into a lookup table.
+
+    period=None stretches it over the event's duration, otherwise it repeats every `period` seconds.
+    """
+    def __init__(self, name, shape, period=None, resolution=512):
+        self.name = name
+        self.period = period
+        self.grid = np.linspace(0.0, 1.0, resolution)
+        self.table = np.clip(np.asarray(shape(self.grid), dtype=float), 0.0, 1.0)
+
+    def envelope(self, t, duration):
+        """Envelope at t seconds into events lasting duration seconds (arrays of the same shape)."""
+        if self.period:
+            u = np.mod(t, self.period) / self.period
+        else:
+            u = np.clip(t / duration, 0.0, 1.0)
+        return np.interp(u, self.grid, self.table)
+
+# Event waveforms by index (VibrationScheduler stores the index); 'fade' is the default
+WAVEFORMS = [
+    WaveformPreset('fade', lambda u: 0.5 * (1.0 + np.cos(np.pi * u))),
+    WaveformPreset('ramp', lambda u: np.minimum(u / 0.9, (1.0 - u) / 0.1)),
+    WaveformPreset('pulse', lambda u: (u < 0.5).astype(float), period=0.5),
+    WaveformPreset('heartbeat', lambda u: np.exp(-((u - 0.1) / 0.04) ** 2) + 0.6 * np.exp(-((u - 0.3) / 0.05) ** 2),
+                   period=1.0),
+]
+WAVEFORM_INDEX = {preset.name: i for i, preset in enumerate(WAVEFORMS)}
+
+class VibrationScheduler:
+    """Vibration events of all players in flat NumPy arrays, rendered a whole block of times at once.
+
+    `version` changes whenever events are added or cleared.
+    """
+    def __init__(self, capacity=64, clock=time.time):
+        self.clock = clock
+        self.count = 0
+        self.version = 0
+        self.start = np.zeros(capacity)
+        self.duration = np.ones(capacity)
+        self.amplitude = np.zeros(capacity)
+        self.player = np.zeros(capacity, dtype=np.intp)
+        self.waveform = np.zeros(capacity, dtype=np.intp)
+        self.carrier_start = clock()
+
+    def add(self, player_index, amplitude, duration, start, waveform=0):
+        if self.count == len(self.start):
+            grow = len(self.start)
+            self.start = np.concatenate([self.start, np.zeros(grow)])
+            self.duration = np.concatenate([self.duration, np.ones(grow)])
+            self.amplitude = np.concatenate([self.amplitude, np.zeros(grow)])
+            self.player = np.concatenate([self.player, np.zeros(grow, dtype=np.intp)])
+            self.waveform = np.concatenate([self.waveform, np.zeros(grow, dtype=np.intp)])
+        i = self.count
+        self.start[i] = start
+        self.duration[i] = max(float(duration), 1e-6)
+        self.amplitude[i] = amplitude
+        self.player[i] = player_index
+        self.waveform[i] = waveform
+        self.count += 1
+        self.version += 1
+
+    def clear(self, player_index=None):
+        self.version += 1
+        if player_index is None:
+            self.count = 0
+            return
+        self._compact(self.player[:self.count] != player_index)
+
+    def _compact(self, keep):
+        kept = int(np.count_nonzero(keep))
+        if kept == self.count:
+            return
+        for arr in (self.start, self.duration, self.amplitude, self.player, self.waveform):
+            arr[:kept] = arr[:self.count][keep]
+        self.count = kept
+
+    def render(self, times, num_players, freq, multiplier=1.0):
+        """Output levels (0..1), shape (num_players, len(times)), for ascending times."""
+        # Events that ended before the block can't contribute any more
+        expired = self.start[:self.count] + self.duration[:self.count] < times[0]
+        if expired.any():
+            self._compact(~expired)
+        n = self.count
+        t = times[None, :] - self.start[:n, None]
+        duration = np.broadcast_to(self.duration[:n, None], t.shape)
+        contrib = np.zeros(t.shape)
+        for w in np.unique(self.waveform[:n]):
+            rows = self.waveform[:n] == w
+            contrib[rows] = WAVEFORMS[w].envelope(t[rows], duration[rows])
+        # Events not started yet or already over add nothing
+        contrib *= ((t >= 0.0) & (t <= duration)) * self.amplitude[:n, None]
+        owner = (self.player[:n][None, :] == np.arange(num_players)[:, None]).astype(float)
+        total = owner @ contrib
+        # clamp combined amplitude, apply global multiplier and the shared 0..1 sine carrier
+        sine = (np.sin(2 * np.pi * freq * (times - self.carrier_start)) + 1.0) / 2.0
+        return np.minimum(total, 1.0) * multiplier * sine
+
+class WaveformEngine:
+    """Renders the scheduler's events into per-device level streams, a block at a time.
+
+    Each stream is low-pass filtered for its device's update rate and resampled onto that rate,
+    so a carrier the device can't follow averages out instead of aliasing.
+    """
+    def __init__(self, scheduler, synth_rate=200.0, block_time=0.5):
+        self.scheduler = scheduler
+        self.synth_rate = synth_rate
+        self.block_time = block_time
+        self.streams = {}  # player index -> [block start, rate, samples, last sample index handed out]
+        self._filters = {}
+        self._key = None
+        self._end = -math.inf
+
+    def lowpass(self, rate):
+        """FIR taps (odd length, unit DC gain) that keep what a device updated rate times per second can show."""
+        taps = self._filters.get(rate)
+        if taps is None:
+            cutoff = 0.4 * rate / self.synth_rate  # cycles per sample
+            # Hamming window: transition band ~3.3 / length; half the cutoff wide, at most one second long
+            half = min(int(3.3 / (0.5 * cutoff)) // 2, int(self.synth_rate) // 2)
+            n = np.arange(-half, half + 1)
+            taps = 2 * cutoff * np.sinc(2 * cutoff * n) * np.hamming(len(n))
+            taps /= taps.sum()
+            self._filters[rate] = taps
+        return taps
+
+    def render(self, now, rates, freq, multiplier=1.0):
+        """Render the block starting at now; rates maps player index -> device update rate (Hz)."""
+        filters = {index: self.lowpass(rate) for index, rate in rates.items()}
+        pad = max((len(taps) // 2 for taps in filters.values()), default=0)
+        count = int(math.ceil(self.block_time * self.synth_rate)) + 1
+        times = now + np.arange(-pad, count + pad) / self.synth_rate
+        levels = self.scheduler.render(times, max(rates, default=-1) + 1, freq, multiplier)
+        block_times = times[pad:pad + count]
+        self.streams = {}
+        for index, rate in rates.items():
+            taps = filters[index]
+            half = len(taps) // 2
+            # 'valid' convolution of the padded block lines up with block_times exactly
+            filtered = np.convolve(levels[index, pad - half:pad + count + half], taps, mode='valid')
+            grid = now + np.arange(int(self.block_time * rate) + 1) / rate
+            samples = np.clip(np.interp(grid, block_times, filtered), 0.0, 1.0)
+            self.streams[index] = [now, rate, samples, -1]
+        self._end = now + self.block_time
+
+    @staticmethod
+    def rate_bucket(rate):
+        # Eighth-octave buckets (~9% wide): a real rate change re-renders, jitter inside a bucket doesn't
+        return round(math.log2(max(rate, 1)) * 8)
+
+    def update(self, now, rates, freq, multiplier=1.0):
+        buckets = tuple(sorted((index, self.rate_bucket(rate)) for index, rate in rates.items()))
+        key = (self.scheduler.version, freq, multiplier, buckets)
+        if key != self._key or now >= self._end:
+            self._key = key
+            self.render(now, rates, freq, multiplier)
+
+    def next_level(self, index, now):
+        """The stream's sample for now, or None if it was already handed out (or there is no stream)."""
+        stream = self.streams.get(index)
+        if stream is None:
+            return None
+        start, rate, samples, last = stream
+        k = min(int((now - start) * rate + 1e-9), len(samples) - 1)
+        if k == last:
+            return None
+        stream[3] = k
+        return float(samples[k])
+
+class DeviceAnnouncements:
+    """Connector observer keeping the raw DeviceMessages the server announced, by device name.
+
+    buttplug-py 0.3 drops StepCount from them; register it before the client connects.
+    """
+    def __init__(self):
+        self.messages = {}
+
+    async def _handle_message(self, msg):
+        # A DeviceList holds DeviceInfo entries; a DeviceAdded describes one device
+        for info in getattr(msg, 'devices', None) or [msg]:
+            name = getattr(info, 'device_name', None)
+            if name is not None:
+                self.messages[name] = getattr(info, 'device_messages', None) or {}
+
+def device_step_count(device, messages=None, default=20):
+    """The VibrateCmd StepCount reported for device (raw messages first, see DeviceAnnouncements), else default."""
+    vibrate = (messages or {}).get('VibrateCmd')
+    steps = vibrate.get('StepCount') if isinstance(vibrate, dict) else None
+    if steps is None:
+        attrs = getattr(device, 'allowed_messages', {}).get('VibrateCmd')
+        steps = getattr(attrs, 'step_count', None)
+    if isinstance(steps, (list, tuple)):
+        steps = min(steps) if steps else None
+    try:
+        steps = int(steps)
+    except (TypeError, ValueError):
+        return default
+    return steps if steps > 0 else default
+
+class DeviceOutput:
+    """Output state and counters of one device in DeviceDispatcher."""
+    def __init__(self, name, device, steps, key=None):
+        self.name = name
+        self.key = key
+        self.device = device
+        self.steps = steps
+        self.sent_level = None  # last level the device acknowledged (None = unknown)
+        self.pending = None     # newest level waiting for a free in-flight slot
+        self.in_flight = 0
+        self.submitted = 0      # levels handed in by the scheduler (the target rate)
+        self.sent = 0           # commands the device acknowledged (the achieved rate)
+        self.skipped = 0        # unchanged after quantization
+        self.dropped = 0        # superseded by a newer level while the device was busy
+        self.errors = 0
+        self.rtt = None         # moving average of the command round trip (seconds)
+
+class DeviceDispatcher:
+    """Non-blocking output stage between the vibration scheduler and the devices.
+
+    Levels are quantized to each device's steps and deduplicated; while a device is busy only the
+    newest level is kept, so a slow toy neither delays the others nor builds up a backlog.
+    """
+    def __init__(self, max_in_flight=1, default_steps=20, MSG=None, metrics=None):
+        self.max_in_flight = max_in_flight
+        self.default_steps = default_steps
+        self.MSG = MSG if MSG is not None else {}
+        self.metrics = metrics
+        self.trace = None  # SessionTrace, records every sent level
+        self.outputs = {}
+        self.started = time.time()
+        self._tasks = set()
+
+    def add(self, key, name, device, messages=None):
+        # messages: the device's raw DeviceMessages, for its StepCount
+        self.outputs[key] = DeviceOutput(name, device, device_step_count(device, messages, self.default_steps), key)
+
+    def submit(self, key, level):
+        out = self.outputs[key]
+        out.submitted += 1
+        q = round(max(0.0, min(1.0, level)) * out.steps) / out.steps
+        upcoming = out.pending if out.pending is not None else out.sent_level
+        if q == upcoming:
+            out.skipped += 1
+            return
+        if out.in_flight >= self.max_in_flight:
+            if out.pending is not None:
+                out.dropped += 1
+            out.pending = q
+            return
+        self._start(out, q)
+
+    def _start(self, out, level):
+        out.in_flight += 1
+        task = asyncio.create_task(self._send(out, level))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _send(self, out, level):
+        started = time.perf_counter()
+        if self.metrics is not None and level > 0:
+            self.metrics.command_sent()
+        try:
+            if level > 0:
+                await out.device.send_vibrate_cmd(level)
+            else:
+                await out.device.send_stop_device_cmd()
+            out.sent += 1
+            out.sent_level = level
+            elapsed = time.perf_counter() - started
+            out.rtt = elapsed if out.rtt is None else 0.8 * out.rtt + 0.2 * elapsed
+            if self.metrics is not None:
+                self.metrics.observe('send:' + out.name, time.perf_counter() - started)
+            if self.trace is not None:
+                self.trace.record(SessionTrace.LEVEL, time.time(), out.key, 0, level, (time.perf_counter() - started) * 1000.0)
+        except Exception as e:
+            out.errors += 1
+            out.sent_level = None
+            if self.trace is not None:
+                self.trace.record(SessionTrace.LEVEL, time.time(), out.key, 1, level, (time.perf_counter() - started) * 1000.0)
+            print(self.MSG.get('error_sending', "Error sending vibrate level to {name}: {err}").format(name=out.name, err=e))
+        finally:
+            out.in_flight -= 1
+        if out.pending is not None and out.in_flight < self.max_in_flight:
+            level, out.pending = out.pending, None
+            if level != out.sent_level:
+                self._start(out, level)
+
+    def update_rate(self, key, max_rate, min_rate=5):
+        """Levels per second the device can take (whole Hz): max_in_flight per round trip, capped at max_rate."""
+        rtt = self.outputs[key].rtt
+        if not rtt:
+            return int(max_rate)
+        return int(max(min_rate, min(max_rate, self.max_in_flight / rtt)))
+
+    async def drain(self):
+        while self._tasks:
+            await asyncio.gather(*list(self._tasks), return_exceptions=True)
+
+    def stats(self):
+        """Per-device counters plus target (submitted) and achieved (sent) commands per second."""
+        elapsed = max(time.time() - self.started, 1e-6)
+        return {out.name: {
+            'steps': out.steps,
+            'target_rate': out.submitted / elapsed,
+            'achieved_rate': out.sent / elapsed,
+            'submitted': out.submitted,
+            'sent': out.sent,
+            'skipped': out.skipped,
+            'dropped': out.dropped,
+            'errors': out.errors,
+        } for out in self.outputs.values()}
+
+    def report(self):
+        for name, st in self.stats().items():
+            print(self.MSG.get('dispatch_stats', "[{name}] commands: {achieved:.1f}/s sent of {target:.1f}/s target (skipped {skipped}, dropped {dropped}, errors {errors})").format(
+                name=name, achieved=st['achieved_rate'], target=st['target_rate'],
+                skipped=st['skipped'], dropped=st['dropped'], errors=st['errors']))
+
 class Player:
-    def __init__(self, name, color_name, device, MSG=None):
+    def __init__(self, name, color_name, device, MSG=None, scheduler=None, index=0):
         self.name = name
         self.color_name = color_name
         self.color_range = DUCK_COLORS.get(color_name)
         self.device = device
         self.intensity = 0.0  # 0.0 to 1.0
         self.vib_task = None
-        # queue of active vibration events: {'start': float, 'duration': float, 'amplitude': float}
-        self.vibration_events = []
+        # vibration events live in the shared VibrationScheduler under this player's index
+        self.scheduler = scheduler
+        self.index = index
         # localized messages dict passed from DuckHaptics
         self.MSG = MSG if MSG is not None else {}
+        self.trace = None  # SessionTrace, set while a session is being recorded
 
     async def update_vibration(self, change):
         # change may be positive (lost) or negative (won)
-        new_intensity = self.intensity + change
+        return self.set_intensity(self.intensity + change)
+
+    def set_intensity(self, value, announce=True):
+        # Every intensity change goes through here so the session trace sees it
+        previous = self.intensity
         # Clamp between 0.0 and 1.0
-        self.intensity = max(0.0, min(1.0, new_intensity))
-        print(self.MSG.get('intensity_status', "[{name}] Intensity: {pct}%").format(name=self.name, pct=int(self.intensity * 100)))
+        self.intensity = max(0.0, min(1.0, value))
+        if self.trace is not None:
+            self.trace.record(SessionTrace.INTENSITY, time.time(), self.index, 0, self.intensity, self.intensity - previous)
+        if announce:
+            print(self.MSG.get('intensity_status', "[{name}] Intensity: {pct}%").format(name=self.name, pct=int(self.intensity * 100)))
         return self.intensity
 
-    def add_vibration_event(self, amplitude, duration):
-        # amplitude is 0..1, duration in seconds
-        ev = {'start': time.time(), 'duration': float(duration), 'amplitude': float(amplitude)}
-        self.vibration_events.append(ev)
+    def add_vibration_event(self, amplitude, duration, waveform='fade'):
+        # amplitude is 0..1, duration in seconds, waveform a WAVEFORMS preset name
+        shape = WAVEFORM_INDEX.get(waveform, 0)
+        if self.scheduler is not None:
+            self.scheduler.add(self.index, float(amplitude), float(duration), self.scheduler.clock(), shape)
+        if self.trace is not None:
+            self.trace.record(SessionTrace.VIBRATION, time.time(), self.index, shape, amplitude, duration)
         print(self.MSG.get('vibration_event_started', "[{name}] Vibration event started: amplitude={amplitude:.2f}, duration={duration:.1f}s").format(name=self.name, amplitude=amplitude, duration=duration))
 
+    def clear_vibration_events(self):
+        if self.scheduler is not None:
+            self.scheduler.clear(self.index)
+
     async def send_vibrate_level(self, level):
         if self.device:
             try:
@@ -69,49 +546,1629 @@ class Player:
             except:
                 pass
 
-class DuckHaptics:
+class ColorClassifier:
+    """Classifies pixels into palette colors with a precomputed BGR lookup table (first listed color wins)."""
+    def __init__(self, palette, bits=6):
+        self.names = list(palette.keys())
+        self.none_index = len(self.names)
+        self.bits = bits
+        self.shift = 8 - bits
+        # HSV of the centre of every quantization bin, in (B, G, R) index order
+        centers = (np.arange(1 << bits) << self.shift) + ((1 << self.shift) >> 1)
+        b, g, r = np.meshgrid(centers, centers, centers, indexing='ij')
+        bgr = np.stack([b, g, r], axis=-1).astype(np.uint8).reshape(-1, 1, 3)
+        hsv = cv2.cvtColor(bgr, cv2.COLOR_BGR2HSV).reshape(-1, 3)
+        self.lut = np.full(len(hsv), self.none_index, dtype=np.uint8)
+        for idx in reversed(range(len(self.names))):
+            lower, upper = palette[self.names[idx]]
+            inside = np.all((hsv >= np.asarray(lower)) & (hsv <= np.asarray(upper)), axis=1)
+            self.lut[inside] = idx
+
+    def classify(self, roi_bgr, min_fraction=0.05):
+        """Return the dominant palette color in roi_bgr, or None below min_fraction of the area."""
+        q = roi_bgr[:, :, :3] >> self.shift
+        index = (q[:, :, 0].astype(np.intp) << (2 * self.bits)) | (q[:, :, 1].astype(np.intp) << self.bits) | q[:, :, 2]
+        counts = np.bincount(self.lut[index].ravel(), minlength=self.none_index + 1)[:self.none_index]
+        if len(counts) == 0:
+            return None
+        best = int(np.argmax(counts))
+        area = roi_bgr.shape[0] * roi_bgr.shape[1]
+        return self.names[best] if counts[best] > area * min_fraction else None
+
+class FrameBuffers:
+    """Preallocated working arrays reused from frame to frame by the detection thread."""
+    def __init__(self, max_entries=16):
+        self.max_entries = max_entries
+        self._arrays = {}
+
+    def get(self, name, shape, dtype=np.uint8):
+        key = (name, shape)
+        buf = self._arrays.get(key)
+        if buf is None:
+            # The geometry changed (ROI vs full frame, new monitor); drop old sizes if too many pile up
+            if len(self._arrays) >= self.max_entries:
+                self._arrays.clear()
+            buf = np.empty(shape, dtype)
+            self._arrays[key] = buf
+        return buf
+
+class Frame:
+    """A captured screen region wrapping the mss BGRA buffer without copying; gray and pyramid are derived once."""
+    def __init__(self, image, timestamp, offset=(0, 0), is_full=True):
+        self.image = image          # H x W x 4 (BGRA from mss) or H x W x 3 (BGR)
+        self.timestamp = timestamp  # time.time() when the frame was grabbed
+        self.offset = offset        # top-left of the frame relative to the monitor
+        self.is_full = is_full      # whole monitor (True) or calibrated ROI (False)
+        self.ring = None            # FrameRing holding the pixels, if any (see DetectionPool)
+        self.slot = None
+        self._gray = None
+        self._pyramid = None
+
+    def release(self):
+        # Hand a shared-memory slot back to its ring; no-op for ordinary frames
+        if self.ring is not None:
+            self.ring.release(self.slot)
+            self.ring = None
+
+    @classmethod
+    def from_screenshot(cls, shot, timestamp, offset=(0, 0), is_full=True):
+        # shot.raw is a fresh bytearray per grab, so the view stays valid for the frame's lifetime
+        image = np.frombuffer(shot.raw, dtype=np.uint8).reshape(shot.height, shot.width, 4)
+        return cls(image, timestamp, offset, is_full)
+
+    @property
+    def shape(self):
+        return self.image.shape[:2]
+
+    @property
+    def bgr(self):
+        return self.image[:, :, :3]
+
+    def gray(self, buffers):
+        if self._gray is None:
+            code = cv2.COLOR_BGRA2GRAY if self.image.shape[2] == 4 else cv2.COLOR_BGR2GRAY
+            self._gray = cv2.cvtColor(self.image, code, dst=buffers.get('gray', self.shape))
+        return self._gray
+
+    def pyramid(self, buffers, levels):
+        if self._pyramid is None or len(self._pyramid) <= levels:
+            level = self.gray(buffers)
+            self._pyramid = [level]
+            for i in range(levels):
+                h, w = level.shape
+                level = cv2.pyrDown(level, dst=buffers.get(('pyr', i), ((h + 1) // 2, (w + 1) // 2)))
+                self._pyramid.append(level)
+        return self._pyramid
+
+class TileChangeTracker:
+    """Reports which tiles of a frame changed since they were last matched.
+
+    Tiles are compared by 4x4 cell means against the signature they had when last reported dirty,
+    so slow fades still add up. State is kept per frame geometry key.
+    """
+    def __init__(self, tile=64, threshold=6, max_keys=4):
+        self.tile = tile
+        self.cell = tile // 4
+        self.threshold = threshold
+        self.max_keys = max_keys
+        # key -> [reference signature, signature, diff, per-tile max, changed mask, downsample buffers]
+        self._state = {}
+
+    def _signature(self, gray, state):
+        # Cell means of gray into state[1]; cells past the frame edge stay 0
+        sig, buffers = state[1], state[5]
+        h, w = gray.shape
+        cell = self.cell
+        cw, ch = w // cell, h // cell
+        for ys, xs in ((slice(0, ch), slice(0, cw)), (slice(0, ch), slice(cw, cw + 1)),
+                       (slice(ch, ch + 1), slice(0, cw)), (slice(ch, ch + 1), slice(cw, cw + 1))):
+            part = gray[ys.start * cell:min(h, ys.stop * cell), xs.start * cell:min(w, xs.stop * cell)]
+            if part.size == 0:
+                continue
+            size = (xs.stop - xs.start, ys.stop - ys.start)
+            buf = buffers.get(size)
+            if buf is None:
+                buf = buffers[size] = np.empty(size[::-1], np.uint8)
+            cv2.resize(part, size, dst=buf, interpolation=cv2.INTER_AREA)
+            sig[ys, xs] = buf
+
+    def update(self, gray, key):
+        """Return a list of dirty (x0, y0, x1, y1) rectangles, or None if the whole frame is new."""
+        h, w = gray.shape
+        cw, ch = -(-w // self.cell), -(-h // self.cell)
+        nx, ny = -(-cw // 4), -(-ch // 4)
+        state = self._state.get(key)
+        if state is None or state[0].shape != (ny * 4, nx * 4):
+            if len(self._state) >= self.max_keys:
+                self._state.clear()
+            state = [np.zeros((ny * 4, nx * 4), np.uint8), np.zeros((ny * 4, nx * 4), np.uint8),
+                     np.empty((ny * 4, nx * 4), np.uint8), np.empty((ny, nx), np.uint8),
+                     np.empty((ny, nx), bool), {}]
+            self._state[key] = state
+            if ch and cw:
+                self._signature(gray, state)
+                state[0][:] = state[1]
+            return None
+        ref, sig, diff, tiles, changed, _ = state
+        if not (ch and cw):
+            return None
+        self._signature(gray, state)
+        cv2.absdiff(sig, ref, dst=diff)
+        np.max(diff.reshape(ny, 4, nx, 4), axis=(1, 3), out=tiles)
+        np.greater(tiles, self.threshold, out=changed)
+        if not changed.any():
+            return []
+        # Dirty tiles are matched again, so they get a new reference
+        np.copyto(ref.reshape(ny, 4, nx, 4), sig.reshape(ny, 4, nx, 4), where=changed[:, None, :, None])
+        count, _, stats, _ = cv2.connectedComponentsWithStats(changed.view(np.uint8), connectivity=8)
+        rects = []
+        for left, top, tw, th, _ in stats[1:count]:
+            rects.append((int(left) * self.tile, int(top) * self.tile,
+                          min(w, int(left + tw) * self.tile), min(h, int(top + th) * self.tile)))
+        return rects
+
+class FFTCorrelator:
+    """Batched TM_CCOEFF_NORMED of one frame against many templates through cv2.dft.
+
+    Agrees with cv2.matchTemplate to within about 3e-3; candidates are always confirmed with matchTemplate.
+    """
+    def __init__(self, max_spectra=256):
+        self.max_spectra = max_spectra
+        self._spectra = {}  # (id(template), dft shape) -> (template, spectrum, norm)
+        self._padded = {}   # dft shape -> float32 frame buffer
+
+    def _spectrum(self, template, shape):
+        key = (id(template), shape)
+        entry = self._spectra.get(key)
+        if entry is not None and entry[0] is template:
+            return entry[1], entry[2]
+        if len(self._spectra) >= self.max_spectra:
+            self._spectra.clear()
+        th, tw = template.shape
+        padded = np.zeros(shape, np.float32)
+        padded[:th, :tw] = template
+        padded[:th, :tw] -= np.float32(template.mean())
+        norm = float(np.sqrt(np.sum(np.square(padded[:th, :tw], dtype=np.float64))))
+        spectrum = cv2.dft(padded)
+        self._spectra[key] = (template, spectrum, norm)
+        return spectrum, norm
+
+    def correlate(self, pyramid, requests):
+        """Return one correlation map per (level, template) request, or None where it does not fit."""
+        out = [None] * len(requests)
+        by_level = {}
+        for i, (level, template) in enumerate(requests):
+            by_level.setdefault(level, []).append(i)
+        for level, indices in by_level.items():
+            image = pyramid[level]
+            h, w = image.shape
+            shape = (cv2.getOptimalDFTSize(h), cv2.getOptimalDFTSize(w))
+            padded = self._padded.get(shape)
+            if padded is None:
+                padded = self._padded[shape] = np.zeros(shape, np.float32)
+            # Rows/columns past the image stay zero, so valid positions never wrap around
+            padded[:h, :w] = image
+            frame_spectrum = cv2.dft(padded)
+            # Window sums on the mean-centred frame keep float32 accurate enough for the variance
+            centred = padded[:h, :w] - np.float32(padded[:h, :w].mean())
+            stds = {}
+            for i in indices:
+                template = requests[i][1]
+                th, tw = template.shape
+                if th > h or tw > w:
+                    continue
+                spectrum, norm = self._spectrum(template, shape)
+                num = cv2.idft(cv2.mulSpectrums(frame_spectrum, spectrum, 0, conjB=True),
+                               flags=cv2.DFT_REAL_OUTPUT | cv2.DFT_SCALE)
+                rows, cols = h - th + 1, w - tw + 1
+                std = stds.get((th, tw))
+                if std is None:
+                    s1 = cv2.boxFilter(centred, -1, (tw, th), normalize=False, anchor=(0, 0),
+                                       borderType=cv2.BORDER_CONSTANT)[:rows, :cols]
+                    s2 = cv2.sqrBoxFilter(centred, -1, (tw, th), normalize=False, anchor=(0, 0),
+                                          borderType=cv2.BORDER_CONSTANT)[:rows, :cols]
+                    # Clamping the window variance keeps flat areas (num ~ 0) from dividing by zero
+                    std = cv2.sqrt(cv2.max(s2 - s1 * s1 * np.float32(1.0 / (th * tw)), 1.0))
+                    stds[(th, tw)] = std
+                out[i] = cv2.divide(num[:rows, :cols], std, scale=1.0 / norm, dtype=cv2.CV_32F)
+        return out
+
+class TemplateMatcher:
+    """Coarse-to-fine, multi-scale TM_CCOEFF_NORMED matching for a single template.
+
+    The last matched scale is tried first plus `scales_per_frame` others round-robin; the best confirmed
+    score wins and scales other than 1.0 need `scale_margin` more. Coarse maps are cached per frame
+    geometry and only rematched over dirty tiles.
+    """
+    def __init__(self, template, threshold, scales=(1.0,), scales_per_frame=3,
+                 max_level=3, min_coarse_size=12, coarse_margin=0.15, scale_margin=0.1, max_keys=4):
+        self.threshold = threshold
+        self.coarse_threshold = threshold - coarse_margin
+        self.scale_margin = scale_margin
+        self.scales_per_frame = scales_per_frame
+        self.max_keys = max_keys
+        # One entry per scale: (scale, level, full-res template, coarse template)
+        self.scaled = []
+        for scale in scales:
+            if scale == 1.0:
+                full = template
+            else:
+                interp = cv2.INTER_AREA if scale < 1.0 else cv2.INTER_LINEAR
+                full = cv2.resize(template, None, fx=scale, fy=scale, interpolation=interp)
+            coarse, level = full, 0
+            while level < max_level and min(coarse.shape) // 2 >= min_coarse_size:
+                coarse = cv2.pyrDown(coarse)
+                level += 1
+            self.scaled.append((scale, level, full, coarse))
+        self.max_level = max(entry[1] for entry in self.scaled)
+        self.last_index = min(range(len(self.scaled)), key=lambda i: abs(math.log(self.scaled[i][0])))
+        self.found = False  # last_index is a scale this template matched at, not just the native guess
+        self._cursor = 0
+        self._maps = {}     # key -> {scale index: coarse correlation map}
+        self._results = {}  # key -> (last match result, best coarse score)
+        self._tried = {}    # key -> scale indices tried since the frame last changed
+        self.last_score = 0.0  # best coarse correlation seen by the last match() call
+
+    def next_scales(self):
+        """Scale indices the next match() call will try, in order (advances the round-robin)."""
+        return self._scale_order()
+
+    def coarse_requests(self, pyramid, order):
+        # (scale index, level, coarse template) for every scale in order that fits the frame
+        requests = []
+        for idx in order:
+            _, level, _, coarse = self.scaled[idx]
+            small = pyramid[level]
+            if small.shape[0] >= coarse.shape[0] and small.shape[1] >= coarse.shape[1]:
+                requests.append((idx, level, coarse))
+        return requests
+
+    def _scale_order(self):
+        others = [i for i in range(len(self.scaled)) if i != self.last_index]
+        if len(others) <= self.scales_per_frame:
+            return [self.last_index] + others
+        picked = [others[(self._cursor + k) % len(others)] for k in range(self.scales_per_frame)]
+        self._cursor = (self._cursor + self.scales_per_frame) % len(others)
+        return [self.last_index] + picked
+
+    def exploring(self, key):
+        # No scale locked in yet and some scale not tried since the frame last changed
+        return not self.found and len(self._tried.get(key, ())) < len(self.scaled)
+
+    def invalidate(self, key=None):
+        # Drop cached maps, e.g. when a frame for this key was seen but not matched
+        if key is None:
+            self._maps.clear()
+            self._results.clear()
+            self._tried.clear()
+        else:
+            self._maps.pop(key, None)
+            self._results.pop(key, None)
+            self._tried.pop(key, None)
+
+    def _coarse_map(self, maps, idx, small, coarse, level, dirty, coarse_maps=None):
+        if coarse_maps is not None and coarse_maps.get(idx) is not None:
+            maps[idx] = coarse_maps[idx]
+            return maps[idx]
+        cached = maps.get(idx)
+        shape = (small.shape[0] - coarse.shape[0] + 1, small.shape[1] - coarse.shape[1] + 1)
+        if dirty is None or cached is None or cached.shape != shape:
+            cached = cv2.matchTemplate(small, coarse, cv2.TM_CCOEFF_NORMED)
+            maps[idx] = cached
+            return cached
+        th, tw = coarse.shape
+        # pyrDown's 5-tap blur lets a change reach 2 * (2**level - 1) full-res pixels further
+        blur = 2 * ((1 << level) - 1)
+        for x0, y0, x1, y1 in dirty:
+            x0, y0, x1, y1 = x0 - blur, y0 - blur, x1 + blur, y1 + blur
+            # Every map position whose template window overlaps the dirty rectangle
+            rx0 = max(0, (x0 >> level) - tw + 1)
+            ry0 = max(0, (y0 >> level) - th + 1)
+            rx1 = min(shape[1], -(-x1 >> level))
+            ry1 = min(shape[0], -(-y1 >> level))
+            if rx1 <= rx0 or ry1 <= ry0:
+                continue
+            cached[ry0:ry1, rx0:rx1] = cv2.matchTemplate(
+                small[ry0:ry1 + th - 1, rx0:rx1 + tw - 1], coarse, cv2.TM_CCOEFF_NORMED)
+        return cached
+
+    def match(self, pyramid, dirty=None, key=None, order=None, coarse_maps=None):
+        """Return (score, x, y, w, h) of the best confirmed match over the scales tried, or None.
+
+        `dirty` lists rectangles changed for `key` (None = all, [] = none); `order` is from next_scales().
+        """
+        static = dirty is not None and not dirty
+        if static and key in self._results and (pyramid is None or not self.exploring(key)):
+            result, self.last_score = self._results[key]
+            return result
+        self.last_score = 0.0
+        if pyramid is None:
+            return None
+        if key not in self._maps and len(self._maps) >= self.max_keys:
+            self.invalidate()
+        maps = self._maps.setdefault(key, {})
+        gray = pyramid[0]
+        result = None
+        refreshed = set()
+        if order is None:
+            order = self._scale_order()
+        for idx in order:
+            scale, level, full, coarse = self.scaled[idx]
+            small = pyramid[level]
+            th, tw = full.shape
+            if small.shape[0] < coarse.shape[0] or small.shape[1] < coarse.shape[1]:
+                continue
+            res = self._coarse_map(maps, idx, small, coarse, level, dirty, coarse_maps)
+            refreshed.add(idx)
+            _, coarse_score, _, (cx, cy) = cv2.minMaxLoc(res)
+            self.last_score = max(self.last_score, coarse_score)
+            if coarse_score < self.coarse_threshold:
+                continue
+            # Confirm at full resolution in a window a couple of coarse pixels around the candidate
+            factor = 1 << level
+            pad = 2 * factor
+            x0 = max(0, cx * factor - pad)
+            y0 = max(0, cy * factor - pad)
+            x1 = min(gray.shape[1], cx * factor + tw + pad)
+            y1 = min(gray.shape[0], cy * factor + th + pad)
+            if x1 - x0 < tw or y1 - y0 < th:
+                continue
+            res = cv2.matchTemplate(gray[y0:y1, x0:x1], full, cv2.TM_CCOEFF_NORMED)
+            _, score, _, (fx, fy) = cv2.minMaxLoc(res)
+            threshold = self.threshold if scale == 1.0 else self.threshold + self.scale_margin
+            if score >= threshold and (result is None or score > result[0]):
+                best = idx
+                result = (score, x0 + fx, y0 + fy, tw, th)
+        if result is not None:
+            self.last_index = best
+            self.found = True
+        # Maps of scales that were not refreshed this frame no longer match the frame
+        for idx in list(maps):
+            if idx not in refreshed:
+                del maps[idx]
+        if static:
+            self._tried.setdefault(key, set()).update(order)
+        else:
+            self._tried[key] = set(order)
+        self._results[key] = (result, self.last_score)
+        return result
+
+class TemplateSpec:
+    """One template image from templates/ and what a match of it means."""
+    def __init__(self, name, image, threshold=0.8, event=None, region='full', classify_color=False,
+                 profile=None, path=None):
+        self.name = name
+        self.image = image
+        self.threshold = threshold
+        self.event = event or name  # EventRegistry key for confirmed matches
+        self.region = region  # 'roi': searched on every frame; 'full': only on full-monitor frames
+        self.classify_color = classify_color  # the match is a banner in a duck's color
+        self.profile = profile  # optional vibration profile, see DuckHaptics.apply_vibration_profile
+        self.path = path
+
+# The built-in templates keep their file names; any other PNG dropped into templates/ is
+# loaded with the defaults of TemplateSpec and can be tuned in templates/templates.json.
+BUILTIN_TEMPLATES = {
+    'template.png': {'name': 'plus_one', 'threshold': 0.75, 'region': 'roi', 'classify_color': True},
+    'intermission.png': {'name': 'intermission', 'threshold': 0.8},
+}
+
+def load_template_specs(directory, config_name='templates.json'):
+    """Return (specs, errors) for the PNG templates in directory.
+
+    templates.json maps a file name to TemplateSpec overrides ({"enabled": false} skips it); errors
+    lists unreadable files, and templates.json if it or one of its entries is malformed.
+    """
+    errors = []
+    config = {}
+    config_path = os.path.join(directory, config_name)
+    if os.path.exists(config_path):
+        try:
+            with open(config_path, 'r', encoding='utf-8') as fh:
+                config = json.load(fh)
+        except (OSError, ValueError):
+            errors.append(config_path)
+        if not isinstance(config, dict):
+            errors.append(config_path)
+            config = {}
+    names = sorted(f for f in os.listdir(directory) if f.lower().endswith('.png')) if os.path.isdir(directory) else []
+    # Built-ins first so +1 and intermission keep their place in the pipeline
+    files = [f for f in BUILTIN_TEMPLATES if f in names or f in config]
+    files += [f for f in list(names) + list(config) if f not in files]
+    specs = []
+    for filename in dict.fromkeys(files):
+        options = dict(BUILTIN_TEMPLATES.get(filename, {}))
+        overrides = config.get(filename, {})
+        if isinstance(overrides, dict):
+            options.update(overrides)
+        elif config_path not in errors:
+            errors.append(config_path)
+        if not options.pop('enabled', True):
+            continue
+        path = os.path.join(directory, filename)
+        image = cv2.imread(path, 0) if os.path.exists(path) else None
+        if image is None:
+            errors.append(path)
+            continue
+        options.setdefault('name', os.path.splitext(filename)[0])
+        try:
+            specs.append(TemplateSpec(image=image, path=path, **options))
+        except TypeError:
+            # Unknown option in templates.json
+            errors.append(config_path)
+    return specs, errors
+
+class TemplateSet:
+    """Every loaded template, matched together against one frame pyramid.
+
+    Large changes can use one batched FFTCorrelator pass instead of a matchTemplate per template;
+    both paths are timed and the cheaper one wins, re-probing the other every `probe_every` batches.
+    """
+    def __init__(self, specs, scales=(1.0,), fft_min_batch=2, fft_dirty_fraction=0.25, probe_every=50):
+        self.specs = list(specs)
+        self.matchers = {spec.name: TemplateMatcher(spec.image, spec.threshold, scales) for spec in self.specs}
+        self.correlator = FFTCorrelator()
+        self.fft_min_batch = fft_min_batch
+        self.fft_dirty_fraction = fft_dirty_fraction
+        self.probe_every = probe_every
+        self.max_level = max([m.max_level for m in self.matchers.values()] or [0])
+        self.costs = {'fft': None, 'spatial': None}
+        self._explore = 0
+        self._batches = 0
+
+    def get(self, name):
+        return self.matchers.get(name)
+
+    def by_event(self, event):
+        return [spec for spec in self.specs if spec.event == event]
+
+    def exploring(self, key, is_full=True):
+        # True if a template searched on this frame still wants a pyramid when nothing changed
+        return any(self.matchers[spec.name].exploring(key) for spec in self.specs
+                   if is_full or spec.region == 'roi')
+
+    def _large_change(self, pyramid, dirty):
+        if dirty is None:
+            return True
+        h, w = pyramid[0].shape
+        area = sum((x1 - x0) * (y1 - y0) for x0, y0, x1, y1 in dirty)
+        return area >= self.fft_dirty_fraction * w * h
+
+    def _pick_path(self):
+        fft, spatial = self.costs['fft'], self.costs['spatial']
+        if fft is None:
+            return 'fft'
+        if spatial is None:
+            return 'spatial'
+        self._batches += 1
+        best, other = ('fft', 'spatial') if fft <= spatial else ('spatial', 'fft')
+        return other if self._batches % self.probe_every == 0 else best
+
+    def match(self, pyramid, dirty=None, key=None, is_full=True, metrics=None):
+        """Return {template name: match or None} for every template searched on this frame.
+
+        Arguments are as for TemplateMatcher.match(); templates with region 'full'
+        are only searched when `is_full` is set.
+        """
+        clock = time.perf_counter
+        active = [spec for spec in self.specs if is_full or spec.region == 'roi']
+        results = {}
+        if pyramid is None or not active:
+            for spec in active:
+                results[spec.name] = self.matchers[spec.name].match(None, dirty, key)
+            return results
+        explorer = active[self._explore % len(active)].name
+        self._explore += 1
+        orders = {}
+        for spec in active:
+            matcher = self.matchers[spec.name]
+            if not matcher.found or spec.name == explorer:
+                orders[spec.name] = matcher.next_scales()
+            else:
+                orders[spec.name] = [matcher.last_index]
+
+        path = None
+        requests, owners = [], []
+        if self._large_change(pyramid, dirty):
+            for spec in active:
+                for idx, level, template in self.matchers[spec.name].coarse_requests(pyramid, orders[spec.name]):
+                    requests.append((level, template))
+                    owners.append((spec.name, idx))
+            if len(requests) >= self.fft_min_batch:
+                path = self._pick_path()
+        started = clock()
+        coarse = {}
+        if path == 'fft':
+            for (name, idx), res in zip(owners, self.correlator.correlate(pyramid, requests)):
+                coarse.setdefault(name, {})[idx] = res
+            if metrics is not None:
+                metrics.observe('match:fft', clock() - started)
+        for spec in active:
+            t = clock()
+            matcher = self.matchers[spec.name]
+            results[spec.name] = matcher.match(pyramid, dirty, key, orders[spec.name], coarse.get(spec.name))
+            if metrics is not None:
+                metrics.observe('match:' + spec.name, clock() - t)
+        if path is not None:
+            cost = (clock() - started) / len(requests)
+            previous = self.costs[path]
+            self.costs[path] = cost if previous is None else 0.8 * previous + 0.2 * cost
+        return results
+
+class Detection:
+    """Result of running the detectors over a single captured frame, or a confirmed event."""
+    def __init__(self, timestamp, intermission=False, color=None, event=None, template=None):
+        self.timestamp = timestamp  # time.time() when the frame was grabbed
+        self.intermission = intermission
+        self.color = color
+        self.event = event          # EventRegistry key of a confirmed event
+        self.template = template    # name of the template that produced the event
+        self.seen = {}        # template name -> color/True if matched, None if searched and not found
+        self.matches = {}     # template name -> (score, x, y, w, h) relative to the frame
+        self.is_full = True   # frame covered the whole monitor (intermission was checked)
+        self.changed = True   # some screen tile changed since the previous frame
+        self.score = 0.0      # best coarse +1 correlation, even below the threshold
+
+class Detector:
+    """Tile diff, pyramid, template matching and color classification for Frames (in-process or in a pool worker)."""
+    def __init__(self, specs, scales=(1.0,), palette=None):
+        self.templates = TemplateSet(specs, scales)
+        # Working arrays reused across frames
+        self.frame_buffers = FrameBuffers()
+        # Frame-diff stage so unchanged screen areas are not matched again
+        self.tile_tracker = TileChangeTracker()
+        self.color_classifier = ColorClassifier(palette or DUCK_COLORS)
+        plus_one = self.templates.by_event('plus_one')
+        self._plus_one = self.templates.get(plus_one[0].name) if plus_one else None
+
+    def detect(self, frame, metrics):
+        clock = time.perf_counter
+        t = clock()
+        gray_frame = frame.gray(self.frame_buffers)
+        t, prev = clock(), t
+        metrics.observe('gray', t - prev)
+        # Only tiles that changed since they were last matched are re-matched; on a fully
+        # static frame every matcher returns its cached result once its scale is settled.
+        key = (frame.offset, frame.shape)
+        dirty = self.tile_tracker.update(gray_frame, key)
+        if dirty != [] or self.templates.exploring(key, frame.is_full):
+            pyramid = frame.pyramid(self.frame_buffers, self.templates.max_level)
+        else:
+            pyramid = None
+        metrics.observe('tiles', clock() - t)
+        detection = Detection(frame.timestamp)
+        detection.is_full = frame.is_full
+        detection.changed = dirty != []
+        # All templates due on this frame in one pass; 'full' templates such as the
+        # intermission screen can't appear in ROI frames, so those only search 'roi' ones.
+        matches = self.templates.match(pyramid, dirty, key, frame.is_full, metrics)
+        if self._plus_one is not None:
+            detection.score = self._plus_one.last_score
+        for spec in self.templates.specs:
+            if spec.name not in matches:
+                continue
+            match = matches[spec.name]
+            if match is None:
+                detection.seen[spec.name] = None
+                continue
+            detection.matches[spec.name] = match
+            if not spec.classify_color:
+                detection.seen[spec.name] = True
+                continue
+            t = clock()
+            _, x, y, w, h = match
+            detection.seen[spec.name] = self.color_classifier.classify(frame.image[y:y+h, x:x+w])
+            metrics.observe('classify', clock() - t)
+        return detection
+
+class Debouncer:
+    """Confirms a value seen on `confirm_frames` consecutive frames, then latches until absent for `clear_frames`."""
+    def __init__(self, confirm_frames=2, clear_frames=4):
+        self.confirm_frames = confirm_frames
+        self.clear_frames = clear_frames
+        self.latched = None
+        self._candidate = None
+        self._seen = 0
+        self._absent = 0
+
+    def update(self, value):
+        if self.latched is not None:
+            if value is None:
+                self._absent += 1
+                if self._absent >= self.clear_frames:
+                    self.latched = None
+                    self._candidate, self._seen = None, 0
+            else:
+                self._absent = 0
+            return None
+        if value is None:
+            self._candidate, self._seen = None, 0
+            return None
+        if value == self._candidate:
+            self._seen += 1
+        else:
+            self._candidate, self._seen = value, 1
+        if self._seen >= self.confirm_frames:
+            self.latched = value
+            self._absent = 0
+            return value
+        return None
+
+    @property
+    def pending(self):
+        return self._candidate is not None and self.latched is None
+
+class DetectionGate:
+    """Turns per-frame detections into events and picks the next capture interval.
+
+    Each template has its own Debouncer; while the intermission is up the others are ignored.
+    """
+    def __init__(self, near_score, fast=1 / 30, normal=1 / 15, idle=0.25, intermission=0.5,
+                 hot_hold=2.0, idle_after=5.0, confirm_frames=2, clear_frames=4, templates=()):
+        self.near_score = near_score
+        self.intervals = {'fast': fast, 'normal': normal, 'idle': idle, 'intermission': intermission}
+        self.hot_hold = hot_hold
+        self.idle_after = idle_after
+        # Intermission templates first, so the others know whether the intermission is up
+        self.templates = sorted(templates, key=lambda spec: spec.event != 'intermission')
+        self.debouncers = {}
+        for spec in self.templates:
+            if spec.region == 'roi':
+                self.debouncers[spec.name] = Debouncer(confirm_frames, clear_frames)
+            else:
+                self.debouncers[spec.name] = Debouncer(1, 2)
+        self.mode = 'normal'
+        self._hot_until = 0.0
+        self._last_change = None
+
+    def update(self, detection):
+        """Return (events, interval); events are Detections to hand to handle_detection()."""
+        now = detection.timestamp
+        events = []
+        hot = detection.score >= self.near_score
+        intermission = False
+        for spec in self.templates:
+            debouncer = self.debouncers[spec.name]
+            if intermission and spec.event != 'intermission':
+                continue
+            if spec.name in detection.seen:
+                value = debouncer.update(detection.seen[spec.name])
+                if value is not None:
+                    events.append(Detection(now, intermission=spec.event == 'intermission',
+                                            color=value if spec.classify_color else None,
+                                            event=spec.event, template=spec.name))
+            if spec.region == 'roi' and (debouncer.pending or debouncer.latched):
+                hot = True
+            if spec.event == 'intermission' and debouncer.latched:
+                intermission = True
+
+        if self._last_change is None or detection.changed:
+            self._last_change = now
+        if hot:
+            self._hot_until = now + self.hot_hold
+        if intermission:
+            self.mode = 'intermission'
+        elif now < self._hot_until:
+            self.mode = 'fast'
+        elif now - self._last_change >= self.idle_after:
+            self.mode = 'idle'
+        else:
+            self.mode = 'normal'
+        return events, self.intervals[self.mode]
+
+class EventRegistry:
+    """Routes confirmed detections to the (plain or coroutine) callbacks registered for their event name."""
     def __init__(self):
-        self.client = ButtplugClient("DuckGame Haptics")
+        self._callbacks = {}
+
+    def register(self, event, callback):
+        self._callbacks.setdefault(event, []).append(callback)
+        return callback
+
+    def unregister(self, event, callback=None):
+        if callback is None:
+            self._callbacks.pop(event, None)
+        elif callback in self._callbacks.get(event, []):
+            self._callbacks[event].remove(callback)
+
+    async def dispatch(self, detection):
+        """Run the callbacks for detection.event in registration order; return how many ran."""
+        callbacks = list(self._callbacks.get(detection.event, []))
+        for callback in callbacks:
+            result = callback(detection)
+            if asyncio.iscoroutine(result):
+                await result
+        return len(callbacks)
+
+class RoiCalibrator:
+    """Learns the sub-rectangle of a monitor where the +1 banner appears.
+
+    A full frame is still grabbed every `full_scan_interval` seconds, and every grab is full again
+    after `fallback_after` seconds without a +1.
+    """
+    def __init__(self, monitor, path, template_size, min_hits=3, fallback_after=60.0, full_scan_interval=2.0):
+        self.monitor = monitor
+        self.path = path  # None keeps the calibration in memory only
+        self.key = "{left},{top},{width},{height}".format(**monitor)
+        self.pad_w, self.pad_h = template_size
+        self.min_hits = min_hits
+        self.fallback_after = fallback_after
+        self.full_scan_interval = full_scan_interval
+        self.roi = None  # (x, y, w, h) relative to the monitor
+        self.calibrating = True
+        self.fallback = False
+        self._box = None  # bounding box of matches seen while calibrating (x0, y0, x1, y1)
+        self._hits = 0
+        self._last_hit = time.time()
+        self._last_full = 0.0
+        self._lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        if self.path is None:
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as fh:
+                stored = json.load(fh).get(self.key)
+        except (OSError, ValueError):
+            stored = None
+        if stored and len(stored) == 4:
+            self.roi = tuple(int(v) for v in stored)
+            self.calibrating = False
+
+    def save(self):
+        if self.path is None:
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as fh:
+                data = json.load(fh)
+        except (OSError, ValueError):
+            data = {}
+        data[self.key] = list(self.roi)
+        try:
+            with open(self.path, 'w', encoding='utf-8') as fh:
+                json.dump(data, fh, indent=2)
+        except OSError:
+            pass
+
+    def set_roi(self, roi):
+        """Use roi (x, y, w, h), e.g. from a profile, without saving it; False if it doesn't fit the monitor."""
+        x, y, w, h = (int(v) for v in roi)
+        if x < 0 or y < 0 or w <= 0 or h <= 0 or x + w > self.monitor['width'] or y + h > self.monitor['height']:
+            return False
+        with self._lock:
+            self.roi = (x, y, w, h)
+            self.calibrating = False
+        return True
+
+    def recalibrate(self):
+        with self._lock:
+            self.roi = None
+            self.calibrating = True
+            self._box = None
+            self._hits = 0
+
+    def next_region(self, now, full=False):
+        """Return (grab_region, offset, is_full) for the next capture; full=True forces a full frame."""
+        with self._lock:
+            self.fallback = self.roi is not None and now - self._last_hit > self.fallback_after
+            use_full = (full or self.roi is None or self.calibrating or self.fallback
+                        or now - self._last_full >= self.full_scan_interval)
+            if use_full:
+                self._last_full = now
+                return self.monitor, (0, 0), True
+            x, y, w, h = self.roi
+        region = {'left': self.monitor['left'] + x, 'top': self.monitor['top'] + y, 'width': w, 'height': h}
+        return region, (x, y), False
+
+    def record_match(self, x, y, w, h, now):
+        """Fold a +1 match (monitor-relative rectangle) into the calibration.
+
+        Returns the new ROI when it changed, otherwise None.
+        """
+        with self._lock:
+            self._last_hit = now
+            x0, y0 = x - self.pad_w, y - self.pad_h
+            x1, y1 = x + w + self.pad_w, y + h + self.pad_h
+            if self.calibrating:
+                if self._box is not None:
+                    bx0, by0, bx1, by1 = self._box
+                    x0, y0, x1, y1 = min(x0, bx0), min(y0, by0), max(x1, bx1), max(y1, by1)
+                self._box = (x0, y0, x1, y1)
+                self._hits += 1
+                if self._hits < self.min_hits:
+                    return None
+                self.calibrating = False
+            elif self.roi is not None:
+                rx, ry, rw, rh = self.roi
+                if rx <= x and ry <= y and x + w <= rx + rw and y + h <= ry + rh:
+                    return None
+                # Matched outside the learned region (found during a full scan): grow it
+                x0, y0 = min(x0, rx), min(y0, ry)
+                x1, y1 = max(x1, rx + rw), max(y1, ry + rh)
+            x0, y0 = max(0, x0), max(0, y0)
+            x1, y1 = min(self.monitor['width'], x1), min(self.monitor['height'], y1)
+            self.roi = (int(x0), int(y0), int(x1 - x0), int(y1 - y0))
+            roi = self.roi
+        self.save()
+        return roi
+
+class FrameRing:
+    """Fixed-size frame slots in one shared_memory block, passed to worker processes by index."""
+    def __init__(self, slot_bytes, slots=4):
+        self.slot_bytes = slot_bytes
+        self.slots = slots
+        self.shm = shared_memory.SharedMemory(create=True, size=slot_bytes * slots)
+        self.name = self.shm.name
+        self._lock = threading.Lock()
+        self._refs = [0] * slots
+        self._next = 0
+
+    def acquire(self):
+        with self._lock:
+            for k in range(self.slots):
+                slot = (self._next + k) % self.slots
+                if self._refs[slot] == 0:
+                    self._refs[slot] = 1
+                    self._next = (slot + 1) % self.slots
+                    return slot
+        return None
+
+    def release(self, slot):
+        with self._lock:
+            self._refs[slot] = max(0, self._refs[slot] - 1)
+
+    def view(self, slot, shape):
+        return np.ndarray(shape, dtype=np.uint8, buffer=self.shm.buf, offset=slot * self.slot_bytes)
+
+    def store(self, image, timestamp, offset=(0, 0), is_full=True):
+        """Copy image into a free slot and return a Frame over it, or None if it can't be placed."""
+        if image.nbytes > self.slot_bytes:
+            return None
+        slot = self.acquire()
+        if slot is None:
+            return None
+        view = self.view(slot, image.shape)
+        view[...] = image
+        frame = Frame(view, timestamp, offset, is_full)
+        frame.ring, frame.slot = self, slot
+        return frame
+
+    def from_screenshot(self, shot, timestamp, offset=(0, 0), is_full=True):
+        image = np.frombuffer(shot.raw, dtype=np.uint8).reshape(shot.height, shot.width, 4)
+        return self.store(image, timestamp, offset, is_full)
+
+    def close(self):
+        try:
+            self.shm.close()
+        except BufferError:
+            pass  # a Frame still holds a view; the mapping goes away with it
+        self.shm.unlink()
+
+class StageLog:
+    """Collects (stage, seconds) in a worker process; the parent replays them into its Metrics."""
+    def __init__(self):
+        self.entries = []
+
+    def observe(self, stage, seconds):
+        self.entries.append((stage, seconds))
+
+def _attach_shared_memory(name):
+    # Workers only borrow the ring; the parent unlinks it. Older Pythons have no track flag,
+    # but spawned workers share the parent's resource tracker, so attaching is harmless there.
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        return shared_memory.SharedMemory(name=name)
+
+def _detection_worker(conn, ring_name, slot_bytes, specs, scales, palette):
+    # Entry point of a DetectionPool process: serve (slot, ...) jobs until None arrives
+    import signal
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # Ctrl+C is handled by the parent
+    cv2.setNumThreads(1)  # the pool already uses one process per core
+    shm = _attach_shared_memory(ring_name)
+    detector = Detector(specs, scales, palette)
+    try:
+        conn.send('ready')
+        while True:
+            job = conn.recv()
+            if job is None:
+                break
+            if job[0] == 'palette':
+                detector.color_classifier = ColorClassifier(job[1])
+                continue
+            slot, shape, timestamp, offset, is_full = job
+            log = StageLog()
+            image = np.ndarray(shape, dtype=np.uint8, buffer=shm.buf, offset=slot * slot_bytes)
+            detection = detector.detect(Frame(image, timestamp, offset, is_full), log)
+            del image
+            conn.send((slot, detection.seen, detection.matches, detection.score, detection.changed, log.entries))
+    except (EOFError, KeyboardInterrupt):
+        pass
+    finally:
+        shm.close()
+
+class DetectionPool:
+    """Template detection fanned out over worker processes, frames passed through a FrameRing.
+
+    Startup and replies time out (`start_timeout`, `timeout`) with EOFError or OSError, so the
+    caller can fall back to in-process detection.
+    """
+    def __init__(self, specs, scales, palette, frame_bytes, workers, slots=4, timeout=5.0, start_timeout=60.0):
+        self.timeout = timeout
+        self._palette = None  # new color palette not yet sent to the workers
+        self.ring = FrameRing(frame_bytes, slots)
+        groups = [[] for _ in range(workers)]
+        loads = [0] * workers
+        for spec in sorted(specs, key=lambda s: s.image.size, reverse=True):
+            i = loads.index(min(loads))
+            groups[i].append(spec)
+            loads[i] += spec.image.size
+        # Spawned (not forked) workers: the parent has threads and open sockets, and Windows spawns anyway
+        context = multiprocessing.get_context('spawn')
+        self.workers = []  # (process, connection, owns an 'roi' template)
+        try:
+            for group in groups:
+                if not group:
+                    continue
+                parent_conn, child_conn = context.Pipe()
+                process = context.Process(target=_detection_worker, name="duck-detect-worker", daemon=True,
+                                          args=(child_conn, self.ring.name, frame_bytes, group, scales, palette))
+                process.start()
+                child_conn.close()
+                self.workers.append((process, parent_conn, any(spec.region == 'roi' for spec in group)))
+            # Wait until every worker has imported OpenCV and built its matchers
+            deadline = time.time() + start_timeout
+            for process, conn, _ in self.workers:
+                self._receive(conn, max(0.0, deadline - time.time()))
+        except BaseException:
+            self.close()
+            raise
+
+    @staticmethod
+    def _receive(conn, timeout):
+        if not conn.poll(timeout):
+            raise TimeoutError(f"no answer from a detection worker in {timeout:.1f} s")
+        return conn.recv()
+
+    def set_palette(self, palette):
+        # Sent ahead of the next job, from the detection thread that owns the pipes
+        self._palette = palette
+
+    def detect(self, frame, metrics):
+        """Return the merged Detection for frame, or None if it doesn't fit in the ring."""
+        owned = None
+        if frame.ring is not self.ring:
+            owned = self.ring.store(frame.image, frame.timestamp, frame.offset, frame.is_full)
+            if owned is None:
+                return None
+            frame = owned
+        try:
+            palette, self._palette = self._palette, None
+            if palette is not None:
+                for _, conn, _ in self.workers:
+                    conn.send(('palette', palette))
+            job = (frame.slot, frame.image.shape, frame.timestamp, frame.offset, frame.is_full)
+            busy = [conn for _, conn, has_roi in self.workers if frame.is_full or has_roi]
+            for conn in busy:
+                conn.send(job)
+            detection = Detection(frame.timestamp)
+            detection.is_full = frame.is_full
+            detection.changed = False
+            for conn in busy:
+                _, seen, matches, score, changed, timings = self._receive(conn, self.timeout)
+                detection.seen.update(seen)
+                detection.matches.update(matches)
+                detection.score = max(detection.score, score)
+                detection.changed = detection.changed or changed
+                for stage, seconds in timings:
+                    metrics.observe(stage, seconds)
+            return detection
+        finally:
+            if owned is not None:
+                owned.release()
+
+    def close(self):
+        for process, conn, _ in self.workers:
+            try:
+                conn.send(None)
+            except (OSError, ValueError):
+                pass
+        for process, conn, _ in self.workers:
+            process.join(timeout=2.0)
+            if process.is_alive():
+                process.terminate()
+                process.join(timeout=1.0)
+            if process.is_alive():
+                process.kill()  # wedged so badly it ignores SIGTERM
+                process.join(timeout=1.0)
+            conn.close()
+        self.workers = []
+        self.ring.close()
+
+class SessionTrace:
+    """Compact binary log of a session (fixed 32-byte records, see trace_tool.py).
+
+    record() never touches the disk; a writer thread flushes, and records are dropped and counted
+    rather than blocking if it falls behind.
+    """
+    MAGIC = b'DSTRACE1'
+    RECORD = struct.Struct('<dBBHfffII')
+    DTYPE = np.dtype([('t', '<f8'), ('kind', 'u1'), ('player', 'u1'), ('code', 'u2'),
+                      ('a', '<f4'), ('b', '<f4'), ('c', '<f4'), ('i', '<u4'), ('j', '<u4')])
+    # Fields by kind:
+    #   FRAME      t=capture time, player=duck color index (255 none), code=flags
+    #              (1 full frame, 2 changed, 4 intermission), a=detect ms, b=+1 score, i=matches
+    #   MATCH      t=capture time, code=template index, a=score, b=w, c=h, i=x, j=y
+    #   EVENT      t=capture time, code=template index, player=color index
+    #   INTENSITY  player, a=new intensity, b=change
+    #   VIBRATION  player, code=waveform index (WAVEFORMS), a=amplitude, b=duration
+    #   LEVEL      player, a=level (0 = stop), b=round trip ms, code=1 on error
+    #   THUMB      t=capture time, i=offset and j=length of a JPEG in the .thumbs file
+    KINDS = {1: 'frame', 2: 'match', 3: 'event', 4: 'intensity', 5: 'vibration', 6: 'level', 7: 'thumb'}
+    FRAME, MATCH, EVENT, INTENSITY, VIBRATION, LEVEL, THUMB = range(1, 8)
+    NONE = 255
+
+    def __init__(self, path, templates=(), colors=(), players=(), capacity=16384, flush_interval=0.5,
+                 thumbnails=False, thumb_width=160, thumb_interval=0.5):
+        self.path = path
+        self.templates = {name: i for i, name in enumerate(templates)}
+        self.colors = {name: i for i, name in enumerate(colors)}
+        self.capacity = capacity
+        self.flush_interval = flush_interval
+        self.thumbnails = thumbnails
+        self.thumb_width = thumb_width
+        self.thumb_interval = thumb_interval
+        self.dropped = 0
+        self.written = 0
+        self._buffer = bytearray(capacity * self.RECORD.size)
+        self._spare = bytearray(capacity * self.RECORD.size)
+        self._count = 0
+        self._lock = threading.Lock()
+        self._flush = threading.Event()
+        self._stop = threading.Event()
+        self._thumbs = collections.deque(maxlen=32)  # (capture time, small image) waiting for JPEG encoding
+        self._last_thumb = 0.0
+
+        header = json.dumps({
+            'version': 1,
+            'started': time.time(),
+            'templates': list(templates),
+            'colors': list(colors),
+            'players': list(players),
+            'kinds': self.KINDS,
+        }).encode('utf-8')
+        offset = len(self.MAGIC) + 4 + len(header)
+        padding = -offset % self.RECORD.size
+        self._fh = open(path, 'wb')
+        self._fh.write(self.MAGIC + struct.pack('<I', len(header) + padding) + header + b' ' * padding)
+        self._thumb_fh = open(path + '.thumbs', 'wb') if thumbnails else None
+        self._thumb_offset = 0
+        self._thread = threading.Thread(target=self._run, name="session-trace", daemon=True)
+        self._thread.start()
+
+    def record(self, kind, t, player=NONE, code=0, a=0.0, b=0.0, c=0.0, i=0, j=0):
+        with self._lock:
+            if self._count >= self.capacity:
+                self.dropped += 1
+                return
+            self.RECORD.pack_into(self._buffer, self._count * self.RECORD.size, t, kind, player, code, a, b, c, i, j)
+            self._count += 1
+            if self._count == self.capacity // 2:
+                self._flush.set()
+
+    def frame(self, detection, detect_seconds):
+        """FRAME record plus one MATCH record per template found on the frame."""
+        flags = (1 if detection.is_full else 0) | (2 if detection.changed else 0) | (4 if detection.intermission else 0)
+        t = detection.timestamp
+        self.record(self.FRAME, t, self.colors.get(detection.color, self.NONE), flags,
+                    detect_seconds * 1000.0, detection.score, 0.0, len(detection.matches))
+        for name, (score, x, y, w, h) in detection.matches.items():
+            self.record(self.MATCH, t, self.NONE, self.templates.get(name, 0xFFFF), score, w, h, x, y)
+
+    def event(self, detection):
+        self.record(self.EVENT, detection.timestamp, self.colors.get(detection.color, self.NONE),
+                    self.templates.get(detection.template, 0xFFFF))
+
+    def thumbnail(self, frame):
+        """Queue a downscaled copy of frame (at most one per thumb_interval); JPEG encoding happens in the writer."""
+        if not self.thumbnails or frame.timestamp - self._last_thumb < self.thumb_interval:
+            return
+        self._last_thumb = frame.timestamp
+        h, w = frame.image.shape[:2]
+        size = (self.thumb_width, max(1, h * self.thumb_width // w))
+        self._thumbs.append((frame.timestamp, cv2.resize(frame.image, size, interpolation=cv2.INTER_AREA)))
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._flush.wait(self.flush_interval)
+            self._flush.clear()
+            self._write()
+        self._write()
+
+    def _write(self):
+        while self._thumbs:
+            t, image = self._thumbs.popleft()
+            ok, jpeg = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, 80])
+            if ok:
+                self._thumb_fh.write(jpeg.tobytes())
+                self.record(self.THUMB, t, i=self._thumb_offset, j=len(jpeg))
+                self._thumb_offset += len(jpeg)
+        with self._lock:
+            full, count = self._buffer, self._count
+            self._buffer, self._spare, self._count = self._spare, full, 0
+        if count:
+            self._fh.write(memoryview(full)[:count * self.RECORD.size])
+            self._fh.flush()
+            self.written += count
+        if self._thumb_fh is not None:
+            self._thumb_fh.flush()
+
+    def close(self):
+        self._stop.set()
+        self._flush.set()
+        self._thread.join(timeout=5.0)
+        self._fh.close()
+        if self._thumb_fh is not None:
+            self._thumb_fh.close()
+
+def parse_address(address, default_host='127.0.0.1', default_port=12346):
+    """'host:port', 'port' or 'host' -> (host, port)."""
+    host, _, port = str(address).rpartition(':')
+    if not host:
+        host, port = (default_host, port) if port.isdigit() else (port, '')
+    return host or default_host, int(port) if port else default_port
+
+class EventPublisher:
+    """Sends confirmed detections to EventSubscriber instances over TCP, one JSON object per line.
+
+    publish() never waits: a subscriber whose send buffer passes max_buffer bytes is disconnected.
+    """
+    def __init__(self, host='0.0.0.0', port=12346, profiles=(), MSG=None, clock=time.time, max_buffer=1 << 16):
+        self.host = host
+        self.port = port
+        self.profiles = [list(p) for p in profiles]  # (event, profile) pairs for the subscribers' registries
+        self.MSG = MSG if MSG is not None else {}
+        self.clock = clock
+        self.max_buffer = max_buffer
+        self.session = os.urandom(4).hex()  # lets subscribers tell a restarted publisher from a reconnect
+        self.seq = 0
+        self.subscribers = set()
+        self._handlers = set()
+        self._server = None
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._serve, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            for writer in list(self.subscribers):
+                writer.close()
+            # Let the connection handlers see their closed sockets and finish
+            await asyncio.gather(*self._handlers, return_exceptions=True)
+            await self._server.wait_closed()
+            self._server = None
+
+    def _send(self, writer, message):
+        writer.write((json.dumps(message) + '\n').encode('utf-8'))
+
+    async def _serve(self, reader, writer):
+        peer = writer.get_extra_info('peername')
+        self._handlers.add(asyncio.current_task())
+        self.subscribers.add(writer)
+        print(self.MSG.get('subscriber_joined', "Subscriber {peer} connected ({n} total).").format(peer=peer, n=len(self.subscribers)))
+        self._send(writer, {'type': 'hello', 'version': 1, 'session': self.session, 'profiles': self.profiles})
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                received = self.clock()
+                try:
+                    message = json.loads(line)
+                except ValueError:
+                    continue
+                if message.get('type') == 'ping':
+                    self._send(writer, {'type': 'pong', 't0': message.get('t0'), 't1': received, 't2': self.clock()})
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self._handlers.discard(asyncio.current_task())
+            self.subscribers.discard(writer)
+            writer.close()
+            print(self.MSG.get('subscriber_left', "Subscriber {peer} disconnected ({n} left).").format(peer=peer, n=len(self.subscribers)))
+
+    def publish(self, detection):
+        if not self.subscribers:
+            return
+        self.seq += 1
+        data = (json.dumps({'type': 'event', 'seq': self.seq, 't': detection.timestamp, 'event': detection.event,
+                            'color': detection.color, 'template': detection.template}) + '\n').encode('utf-8')
+        for writer in list(self.subscribers):
+            if writer.transport.get_write_buffer_size() > self.max_buffer:
+                # Not reading; it will reconnect and resync
+                self.subscribers.discard(writer)
+                writer.close()
+                continue
+            writer.write(data)
+
+class EventSubscriber:
+    """Receives detections from an EventPublisher and hands them to handler as Detection objects.
+
+    Event times are moved to the local clock with an NTP-style offset estimate; events older than
+    max_age seconds are dropped.
+    """
+    def __init__(self, address, handler, on_hello=None, MSG=None, metrics=None, clock=time.time,
+                 sync_interval=5.0, samples=8, max_age=2.0):
+        self.host, self.port = parse_address(address)
+        self.handler = handler
+        self.on_hello = on_hello
+        self.MSG = MSG if MSG is not None else {}
+        self.metrics = metrics
+        self.clock = clock
+        self.sync_interval = sync_interval
+        self.max_age = max_age
+        self.offset = 0.0   # publisher clock - local clock
+        self.delay = None   # round trip of the sample the offset came from
+        self._samples = collections.deque(maxlen=samples)
+        self._session = None
+        self._last_seq = 0
+        self.received = 0
+        self.stale = 0
+        self.reconnects = 0
+        self.connected = asyncio.Event()
+        self._closing = False
+
+    def stats(self):
+        return {'received': self.received, 'stale': self.stale, 'reconnects': self.reconnects,
+                'offset': self.offset, 'delay': self.delay}
+
+    def close(self):
+        self._closing = True
+
+    async def run(self):
+        backoff = 0.5
+        while not self._closing:
+            try:
+                reader, writer = await asyncio.open_connection(self.host, self.port)
+            except OSError as e:
+                print(self.MSG.get('subscriber_retry', "Cannot reach publisher {host}:{port} ({err}); retrying.").format(host=self.host, port=self.port, err=e))
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 5.0)
+                continue
+            backoff = 0.5
+            print(self.MSG.get('subscriber_connected', "Receiving events from {host}:{port}.").format(host=self.host, port=self.port))
+            pinger = asyncio.create_task(self._ping(writer))
+            try:
+                await self._read(reader)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                pass
+            finally:
+                pinger.cancel()
+                writer.close()
+                self.connected.clear()
+            if not self._closing:
+                self.reconnects += 1
+
+    async def _ping(self, writer):
+        # A quick burst so the first offset is good, then one sample every sync_interval
+        count = 0
+        while True:
+            writer.write((json.dumps({'type': 'ping', 't0': self.clock()}) + '\n').encode('utf-8'))
+            count += 1
+            await asyncio.sleep(0.05 if count < self._samples.maxlen else self.sync_interval)
+
+    async def _read(self, reader):
+        while not self._closing:
+            line = await reader.readline()
+            if not line:
+                return
+            received = self.clock()
+            try:
+                message = json.loads(line)
+            except ValueError:
+                continue
+            kind = message.get('type')
+            if kind == 'pong':
+                t0, t1, t2 = message['t0'], message['t1'], message['t2']
+                self._samples.append((received - t0 - (t2 - t1), ((t1 - t0) + (t2 - received)) / 2.0))
+                self.delay, self.offset = min(self._samples)
+                self.connected.set()
+            elif kind == 'hello':
+                if message.get('session') != self._session:
+                    self._session, self._last_seq = message.get('session'), 0
+                if self.on_hello is not None:
+                    self.on_hello(message)
+            elif kind == 'event':
+                await self._event(message, received)
+
+    async def _event(self, message, received):
+        seq = message.get('seq', 0)
+        if seq <= self._last_seq:
+            return
+        self._last_seq = seq
+        timestamp = message['t'] - self.offset
+        age = received - timestamp
+        if self.metrics is not None:
+            self.metrics.observe('event_age', max(0.0, age))
+        if age > self.max_age:
+            self.stale += 1
+            return
+        self.received += 1
+        event = message.get('event')
+        detection = Detection(timestamp, intermission=event == 'intermission', color=message.get('color'),
+                              event=event, template=message.get('template'))
+        await self.handler(detection)
+
+class CaptureWorker:
+    """Screen capture and detection threads feeding confirmed events to an asyncio.Queue.
+
+    Only the newest grab is kept, so the vibration tasks never wait on capture or matching.
+    """
+    def __init__(self, haptics, monitor, loop, queue, gate, calibrator=None):
+        self.haptics = haptics
+        self.monitor = monitor
+        self.calibrator = calibrator
+        self.loop = loop
+        self.queue = queue
+        self.gate = gate
+        self.interval = gate.intervals['normal']
+        self._lock = threading.Lock()
+        self._latest = None  # newest Frame not yet picked up by the detection thread
+        self._frame_ready = threading.Event()
+        self._wake = threading.Event()  # cuts a capture wait short (stop, or a faster poll rate)
+        self._stop = threading.Event()
+        self._threads = []
+        self.max_errors = 20  # consecutive failures of one thread before the capture gives up
+        self.error = None     # set when it gave up; game_loop stops then
+
+    def start(self):
+        self._threads = [
+            threading.Thread(target=self._capture_run, name="duck-capture", daemon=True),
+            threading.Thread(target=self._detect_run, name="duck-detect", daemon=True),
+        ]
+        for t in self._threads:
+            t.start()
+
+    def stop(self):
+        self._stop.set()
+        self._frame_ready.set()
+        self._wake.set()
+        for t in self._threads:
+            t.join(timeout=2.0)
+        self._threads = []
+
+    def _capture_run(self):
+        # mss handles are not safe to share between threads, so the capture thread owns its own
+        sct = None
+        errors = 0
+        try:
+            while not self._stop.is_set():
+                started = time.time()
+                try:
+                    if sct is None:
+                        sct = mss.mss()
+                    if self.calibrator is not None:
+                        # Full frames while the intermission is up, so its end is seen promptly
+                        region, offset, is_full = self.calibrator.next_region(started, self.gate.mode == 'intermission')
+                    else:
+                        region, offset, is_full = self.monitor, (0, 0), True
+                    grab_started = time.perf_counter()
+                    shot = sct.grab(region)
+                    pool = self.haptics.pool
+                    frame = pool.ring.from_screenshot(shot, started, offset, is_full) if pool is not None else None
+                    if frame is None:
+                        frame = Frame.from_screenshot(shot, started, offset, is_full)
+                    self.haptics.metrics.observe('grab', time.perf_counter() - grab_started)
+                    errors = 0
+                except Exception as e:
+                    # e.g. the display configuration changed under us; a fresh mss handle usually recovers
+                    if sct is not None:
+                        try:
+                            sct.close()
+                        except Exception:
+                            pass
+                        sct = None
+                    errors += 1
+                    if not self._record_error('error_capture', "Screen capture failed: {err}", e, errors):
+                        return
+                    self._stop.wait(self.interval)
+                    continue
+                with self._lock:
+                    previous, self._latest = self._latest, frame
+                if previous is not None:
+                    # Overwritten before the detection thread got to it
+                    previous.release()
+                self._frame_ready.set()
+                # Wait out the rest of the interval; recomputed if the gate asks for a faster rate
+                while not self._stop.is_set():
+                    remaining = self.interval - (time.time() - started)
+                    if remaining <= 0 or not self._wake.wait(remaining):
+                        break
+                    self._wake.clear()
+        finally:
+            if sct is not None:
+                try:
+                    sct.close()
+                except Exception:
+                    pass
+
+    def _detect_run(self):
+        errors = 0
+        while not self._stop.is_set():
+            if not self._frame_ready.wait(timeout=0.5):
+                continue
+            self._frame_ready.clear()
+            with self._lock:
+                frame, self._latest = self._latest, None
+            if frame is None:
+                continue
+            try:
+                detection = self.haptics.detect(frame, self.calibrator)
+                events, interval = self.gate.update(detection)
+                errors = 0
+            except Exception as e:
+                errors += 1
+                if not self._record_error('error_detection', "Detection failed: {err}", e, errors):
+                    return
+                continue
+            if interval < self.interval:
+                self.interval = interval
+                self._wake.set()
+            else:
+                self.interval = interval
+            for event in events:
+                self.loop.call_soon_threadsafe(self._post, event)
+
+    def _record_error(self, key, default, error, errors):
+        """Report a failed capture/detection step; False once max_errors in a row means give up."""
+        if errors == 1:
+            print(self.haptics.MSG.get(key, default).format(err=error))
+        if errors < self.max_errors:
+            return True
+        # Both threads stop and game_loop sees `error` and shuts down
+        self.error = error
+        self._stop.set()
+        self._frame_ready.set()
+        self._wake.set()
+        return False
+
+    def _post(self, detection):
+        # Runs on the event loop thread; if the loop falls behind keep the newest results
+        if self.queue.full():
+            try:
+                self.queue.get_nowait()
+            except asyncio.QueueEmpty:
+                pass
+        self.queue.put_nowait(detection)
+
+class DuckHaptics:
+    def __init__(self, defer_templates=False):
+        """defer_templates=True leaves loading the templates to a later load_templates() call."""
+        self._client = None
+        self.device_announcements = DeviceAnnouncements()
         self.players = []
-        self.sct = mss.mss()
+        self._sct = None
         self.running = True
 
-        path_imagen = resolve_path('templates/template.png')
-        self.template = cv2.imread(path_imagen, 0)
+        self.lang = 'en'
+        self.MSG = {}
 
-        if self.template is None:
-                # Tip: print the path when it fails to help debugging
-            print(self.MSG.get('no_template', f"Error: Could not load {path_imagen}").format(path=path_imagen))
-            self.w, self.h = 0, 0
-        else:
-            self.w, self.h = self.template.shape[::-1]
-        
-        # Cache for normalized template
-        self.template_mean = 0
-        self.template_std = 0
-        if self.template is not None:
-            self.template_mean = np.mean(self.template)
-            self.template_std = np.std(self.template)
-            if self.template_std == 0:
-                self.template_std = 1
-
-        # Load optional intermission template to detect intermissions/screens
-        inter_path = resolve_path('templates/intermission.png')
-        self.intermission_template = None
-        if os.path.exists(inter_path):
-            self.intermission_template = cv2.imread(inter_path, 0)
+        # Duck colors are classified through a lookup table compiled from this palette
+        self.color_palette = DUCK_COLORS
+
+        # Confirmed detections are routed by event name (see load_templates / handle_detection)
+        self.events = EventRegistry()
+        self.events.register('intermission', self.on_intermission)
+        self.events.register('plus_one', self.on_plus_one)
+
+        # Template scales tried when the game window is not at the resolution the templates were cut from
+        self.template_scales = (0.5, 0.6, 0.67, 0.75, 0.8, 0.9, 1.0, 1.1, 1.25, 1.33, 1.5, 1.75, 2.0)
+        self.templates_dir = resolve_path('templates')
+        self._profile_callbacks = []
+        self.event_profiles = []
+        self.templates = None
+        if not defer_templates:
+            self.load_templates()
 
         # Runtime settings
+        self.intiface_address = "ws://127.0.0.1:12345"  # Intiface Central, or mock_intiface.py
+        self.scan_time = 2.0  # longest wait for devices; scanning stops early once the expected ones are found
         self.monitor = None
+        self.monitor_index = 1
         self.intensity_multiplier = 1.0
-        self.vibration_freq = 40.0   # Hz for sine wave
-        self.vibration_rate = 40.0   # updates per second
-        self.lang = 'en'
-        self.MSG = {}
+        self.vibration_freq = 40.0   # Hz for sine wave; parts faster than a device can follow are averaged out
+        self.vibration_rate = 40.0   # updates per second (at most; slower devices get their own rate)
+        self.plus_one_waveform = 'fade'  # WAVEFORMS preset for the vibration a lost +1 starts
+        # Seconds between screen grabs; the rate adapts to what is on screen (see DetectionGate)
+        self.capture_interval_fast = 1 / 30    # a +1 is building up or a round looks about to end
+        self.capture_interval = 1 / 15         # normal play
+        self.capture_interval_idle = 0.25      # nothing on screen changed for a while
+        self.capture_interval_intermission = 0.5
+        # A +1 must be seen on this many consecutive frames, and gone for clear_frames before it can count again
+        self.confirm_frames = 2
+        self.clear_frames = 4
+        # Region-of-interest capture for the +1 banner (learned per monitor, see RoiCalibrator)
+        self.use_roi = True
+        self.recalibrate_roi = False
+        self.roi_path = user_data_path('roi_calibration.json')
+        self.roi = None  # (x, y, w, h) from a profile, then the region learned while playing
+        # Saved setups (language, monitor, multiplier, players, ROI), see load_profile / save_profile
+        self.profiles_path = user_data_path('profiles.json')
+        # Detection worker processes (None = one per spare CPU core, up to one per template; 0 = in-process)
+        self.detection_workers = None
+        self.pool = None
         self.vibration_tasks = []
+        # Per-stage latency histograms; dumped to metrics_dir every metrics_interval seconds if set
+        self.metrics = Metrics()
+        self.metrics_dir = None
+        self.metrics_interval = 10.0
+        # Detection fan-out: publish_address ("[host:]port") makes this instance send its confirmed
+        # events to subscribers (see EventPublisher / subscriber_loop)
+        self.publish_address = None
+        self.publisher = None
+        self.subscriber = None
+        # Binary session trace (see SessionTrace / trace_tool.py); off unless trace_path is set
+        self.trace_path = None
+        self.trace_thumbnails = False
+        self.trace = None
+        # One scheduler holds every player's vibration events; the waveform engine renders
+        # them ahead of time into a level stream per device
+        self.scheduler = VibrationScheduler()
+        self.waveforms = WaveformEngine(self.scheduler)
+        # Output stage (created with the vibration task); commands allowed in flight per device
+        self.dispatcher = None
+        self.max_in_flight = 1
         # Duration curve parameter: controls how duration shrinks with intensity
         self.duration_curve_exponent = 0.7
 
+    def load_templates(self, directory=None):
+        """(Re)load every template in the templates directory and register their vibration profiles."""
+        if directory is not None:
+            self.templates_dir = directory
+        specs, errors = load_template_specs(self.templates_dir)
+        for path in errors:
+            print(self.MSG.get('no_template', "Error: Could not load {path}").format(path=path))
+        self.set_event_profiles([(spec.event, spec.profile) for spec in specs if spec.profile])
+        self.detector = Detector(specs, self.template_scales, self.color_palette)
+        self.templates = self.detector.templates
+
+        # The +1 and intermission templates are still reachable directly
+        plus_one = self.templates.by_event('plus_one')
+        self.template = plus_one[0].image if plus_one else None
+        self.h, self.w = self.template.shape if self.template is not None else (0, 0)
+        self.plus_one_matcher = self.templates.get(plus_one[0].name) if plus_one else None
+        intermission = self.templates.by_event('intermission')
+        self.intermission_template = intermission[0].image if intermission else None
+
+    def set_event_profiles(self, profiles):
+        """Register (event, vibration profile) pairs; profiles of a previous call are replaced, not stacked."""
+        for event, callback in self._profile_callbacks:
+            self.events.unregister(event, callback)
+        self._profile_callbacks = []
+        self.event_profiles = [(event, profile) for event, profile in profiles]
+        for event, profile in self.event_profiles:
+            callback = self._profile_callback(profile)
+            self.events.register(event, callback)
+            self._profile_callbacks.append((event, callback))
+
+    @property
+    def client(self):
+        # Created on first use so importing buttplug stays off the startup path
+        if self._client is None:
+            self._client = buttplug_client.ButtplugClient("DuckGame Haptics")
+        return self._client
+
+    @property
+    def sct(self):
+        # Opened on first use so the detection pipeline can run headless (see replay.py)
+        if self._sct is None:
+            self._sct = mss.mss()
+        return self._sct
+
     def duration_for_intensity(self, intensity):
         """Map intensity (0..1) to duration in seconds.
         First (low intensity) -> ~20s, last (high intensity) -> ~10s.
@@ -124,36 +2181,60 @@ class DuckHaptics:
         dur = min_d + (1.0 - intensity) ** self.duration_curve_exponent * (max_d - min_d)
         return dur
 
-    async def connect_intiface(self):
+    def _has_devices(self, wanted):
+        have = collections.Counter(d.name for d in self.client.devices.values())
+        return all(have[name] >= n for name, n in collections.Counter(wanted).items())
+
+    async def connect_intiface(self, wanted=None):
+        """Connect and scan for devices; scanning stops early once every name in wanted is known."""
         print(self.MSG.get('connecting', "Connecting to Intiface Central..."))
-        connector = ButtplugClientWebsocketConnector("ws://127.0.0.1:12345")
+        connector = buttplug_client.ButtplugClientWebsocketConnector(self.intiface_address)
+        # Ahead of the client's own observer, so step counts are known when devices are added
+        connector.add_observer(self.device_announcements)
         try:
             await self.client.connect(connector)
             print(self.MSG.get('connected', "Connected to Intiface!"))
         except Exception as e:
                 print(self.MSG.get('error_connecting', "Error connecting to Intiface: {err}").format(err=e))
-        
+                return False
+
+        if wanted and self._has_devices(wanted):
+            return True
         print(self.MSG.get('scanning', "Scanning for devices..."))
-        await self.client.start_scanning()
-        await asyncio.sleep(2)
-        await self.client.stop_scanning()
-        
+        found = asyncio.Event()
+        def on_device_added(client, device):
+            if wanted and self._has_devices(wanted):
+                found.set()
+        self.client.device_added_handler += on_device_added
+        try:
+            await self.client.start_scanning()
+            try:
+                await asyncio.wait_for(found.wait(), timeout=self.scan_time)
+            except asyncio.TimeoutError:
+                pass
+            await self.client.stop_scanning()
+        finally:
+            self.client.device_added_handler -= on_device_added
+
         if not self.client.devices:
             print(self.MSG.get('no_devices', "No devices found. Make sure they are connected in Intiface."))
             return False
         return True
 
-    def set_language(self):
-        # Choose language using indices so text differences can't break selection
-        # Show bilingual language prompt (before MSG is selected)
-        print("Select language / Selecciona idioma:")
-        print("0: English")
-        print("1: Español")
-        try:
-            choice = int(input("Choice (0/1): "))
-        except:
-            choice = 0
-        self.lang = 'es' if choice == 1 else 'en'
+    def set_language(self, lang=None):
+        if lang in ('en', 'es'):
+            self.lang = lang
+        else:
+            # Choose language using indices so text differences can't break selection
+            # Show bilingual language prompt (before MSG is selected)
+            print("Select language / Selecciona idioma:")
+            print("0: English")
+            print("1: Español")
+            try:
+                choice = int(input("Choice (0/1): "))
+            except:
+                choice = 0
+            self.lang = 'es' if choice == 1 else 'en'
 
         self.MSG = {
             'en': {
@@ -186,6 +2267,30 @@ class DuckHaptics:
                 'vibration_event_started': "[{name}] Vibration event started: amplitude={amplitude:.2f}, duration={duration:.1f}s",
                 'error_vibrating_device': "Error vibrating device {name}: {err}",
                 'error_sending': "Error sending vibrate level to {name}: {err}",
+                'roi_calibrating': "Calibrating capture region: scanning the full screen until a few +1 are seen.",
+                'roi_calibrated': "Capture region calibrated: {roi}",
+                'roi_loaded': "Using calibrated capture region: {roi}",
+                'roi_profile_invalid': "The profile's capture region {roi} does not fit this monitor; ignoring it.",
+                'dispatch_stats': "[{name}] commands: {achieved:.1f}/s sent of {target:.1f}/s target (skipped {skipped}, dropped {dropped}, errors {errors})",
+                'error_metrics': "Error writing metrics: {err}",
+                'detected_event': "Detected {event}.",
+                'detect_pool_started': "Detection running in {n} worker processes.",
+                'error_detect_pool': "Detection workers stopped ({err}); continuing in-process.",
+                'error_capture': "Screen capture failed: {err}",
+                'error_detection': "Detection failed: {err}",
+                'capture_stopped': "Capture stopped after repeated errors ({err}).",
+                'publishing': "Publishing events on port {port}.",
+                'subscriber_joined': "Subscriber {peer} connected ({n} total).",
+                'subscriber_left': "Subscriber {peer} disconnected ({n} left).",
+                'starting_subscriber': "--- RECEIVING DUCK GAME EVENTS ---",
+                'subscriber_connected': "Receiving events from {host}:{port}.",
+                'subscriber_retry': "Cannot reach publisher {host}:{port} ({err}); retrying.",
+                'trace_started': "Recording session trace to {path}",
+                'trace_dropped': "Session trace: {n} records dropped (writer fell behind).",
+                'profile_loaded': "Using profile '{name}'.",
+                'profile_not_found': "Profile '{name}' not found in {path}.",
+                'profile_saved': "Profile '{name}' saved.",
+                'profile_device_missing': "Device '{dev}' from the profile is not connected; choose the players again.",
                 'program_finished': "Program finished."
             },
             'es': {
@@ -218,24 +2323,60 @@ class DuckHaptics:
                 'vibration_event_started': "[{name}] Evento iniciado: amplitud={amplitude:.2f}, duración={duration:.1f}s",
                 'error_vibrating_device': "Error vibrando el dispositivo {name}: {err}",
                 'error_sending': "Error enviando nivel de vibración a {name}: {err}",
+                'roi_calibrating': "Calibrando la región de captura: escaneando la pantalla completa hasta ver algunos +1.",
+                'roi_calibrated': "Región de captura calibrada: {roi}",
+                'roi_loaded': "Usando la región de captura calibrada: {roi}",
+                'roi_profile_invalid': "La región de captura del perfil {roi} no cabe en este monitor; se ignora.",
+                'dispatch_stats': "[{name}] comandos: {achieved:.1f}/s enviados de {target:.1f}/s objetivo (omitidos {skipped}, descartados {dropped}, errores {errors})",
+                'error_metrics': "Error escribiendo métricas: {err}",
+                'detected_event': "Detectado {event}.",
+                'detect_pool_started': "Detección ejecutándose en {n} procesos.",
+                'error_detect_pool': "Los procesos de detección se detuvieron ({err}); continuando en el proceso principal.",
+                'error_capture': "Falló la captura de pantalla: {err}",
+                'error_detection': "Falló la detección: {err}",
+                'capture_stopped': "La captura se detuvo tras errores repetidos ({err}).",
+                'publishing': "Publicando eventos en el puerto {port}.",
+                'subscriber_joined': "Suscriptor {peer} conectado ({n} en total).",
+                'subscriber_left': "Suscriptor {peer} desconectado (quedan {n}).",
+                'starting_subscriber': "--- RECIBIENDO EVENTOS DE DUCK GAME ---",
+                'subscriber_connected': "Recibiendo eventos de {host}:{port}.",
+                'subscriber_retry': "No se puede conectar con el publicador {host}:{port} ({err}); reintentando.",
+                'trace_started': "Grabando la traza de la sesión en {path}",
+                'trace_dropped': "Traza de la sesión: {n} registros descartados (la escritura se retrasó).",
+                'profile_loaded': "Usando el perfil '{name}'.",
+                'profile_not_found': "No se encontró el perfil '{name}' en {path}.",
+                'profile_saved': "Perfil '{name}' guardado.",
+                'profile_device_missing': "El dispositivo '{dev}' del perfil no está conectado; elige los jugadores de nuevo.",
                 'program_finished': "Programa finalizado."
             }
         }
         self.MSG = self.MSG[self.lang]
 
-    def configure_settings(self):
-        # Monitor selection (index-based to avoid language issues)
-        print(self.MSG.get('available_monitors', "Available monitors:"))
-        for idx, mon in enumerate(self.sct.monitors):
-            print(f"{idx}: {mon}")
-        try:
-            mon_idx = int(input(self.MSG.get('select_monitor_idx', "Select monitor index (default 1): ")))
-            self.monitor = self.sct.monitors[mon_idx]
-        except:
-            print(self.MSG.get('invalid_monitor', "Invalid monitor selection, using main monitor (1)."))
-            self.monitor = self.sct.monitors[1]
+    def configure_settings(self, monitor_index=None, multiplier=None):
+        # Values passed in (command line / profile) skip their prompt
+        self.configure_monitor(monitor_index)
+        self.configure_multiplier(multiplier)
 
-        # Intensity multiplier
+    def configure_monitor(self, monitor_index=None):
+        if monitor_index is not None and 0 <= monitor_index < len(self.sct.monitors):
+            self.monitor_index = monitor_index
+        else:
+            # Monitor selection (index-based to avoid language issues)
+            print(self.MSG.get('available_monitors', "Available monitors:"))
+            for idx, mon in enumerate(self.sct.monitors):
+                print(f"{idx}: {mon}")
+            try:
+                self.monitor_index = int(input(self.MSG.get('select_monitor_idx', "Select monitor index (default 1): ")))
+                self.sct.monitors[self.monitor_index]
+            except:
+                print(self.MSG.get('invalid_monitor', "Invalid monitor selection, using main monitor (1)."))
+                self.monitor_index = 1
+        self.monitor = self.sct.monitors[self.monitor_index]
+
+    def configure_multiplier(self, multiplier=None):
+        if multiplier is not None and 0.0 <= multiplier <= 1.0:
+            self.intensity_multiplier = float(multiplier)
+            return
         try:
             v = float(input(self.MSG.get('set_intensity_multiplier', "Set global intensity multiplier (0.0 to 1.0, default 1.0): ")))
             if 0.0 <= v <= 1.0:
@@ -245,15 +2386,28 @@ class DuckHaptics:
         except:
             self.intensity_multiplier = 1.0
 
-    async def setup_players(self):
+    async def setup_players(self, assignments=None):
+        """Ask for each player's duck color and device, or take (color, device) pairs from assignments."""
+        available_devices = list(self.client.devices.values())
+        colors = list(DUCK_COLORS.keys())
+        if assignments is not None:
+            for color, device in assignments:
+                if isinstance(device, int):
+                    device = available_devices[device]
+                elif isinstance(device, str):
+                    used = [p.device for p in self.players]
+                    device = next(d for d in available_devices if d.name == device and d not in used)
+                player = Player(f"P{len(self.players)+1}", color, device, self.MSG, self.scheduler, len(self.players))
+                self.players.append(player)
+                print(self.MSG.get('player_ready', "Player {i} ready: {color} -> {dev}").format(i=len(self.players), color=color, dev=device.name))
+            self.start_vibration_tasks()
+            return
+
         try:
             num_players = int(input(self.MSG.get('how_many_players', "How many players (with toys) will play? ")))
         except:
             num_players = 1
 
-        available_devices = list(self.client.devices.values())
-        colors = list(DUCK_COLORS.keys())
-
         for i in range(num_players):
             print(self.MSG.get('configuring_player', "--- Configuring Player {n} ---").format(n=i+1))
             print(self.MSG.get('colors_available', "Available colors:"))
@@ -280,178 +2434,452 @@ class DuckHaptics:
                 print(self.MSG.get('invalid_selection_assign_first', "Invalid selection, assigning the first one."))
                 device = available_devices[0]
 
-            player = Player(f"P{i+1}", color, device, self.MSG)
+            player = Player(f"P{i+1}", color, device, self.MSG, self.scheduler, len(self.players))
             self.players.append(player)
             print(self.MSG.get('player_ready', "Player {i} ready: {color} -> {dev}").format(i=i+1, color=color, dev=device.name))
 
-        # Start the per-player vibration tasks
+        # Start the vibration scheduler task
         self.start_vibration_tasks()
 
-    def detect_winner_color(self, frame):
-        if self.template is None:
+    def load_profile(self, name):
+        """Return the saved profile called name, or None."""
+        try:
+            with open(self.profiles_path, 'r', encoding='utf-8') as fh:
+                return json.load(fh).get(name)
+        except (OSError, ValueError):
             return None
 
-        # Convert to grayscale for template matching
-        gray_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        
-        # Template Matching with normalized correlation
-        res = cv2.matchTemplate(gray_frame, self.template, cv2.TM_CCOEFF_NORMED)
-        
-        threshold = 0.75
-        loc = np.where(res >= threshold)
-        
-        if len(loc[0]) == 0:
+    def save_profile(self, name):
+        """Store the current language, monitor, multiplier, players and ROI as profile name."""
+        try:
+            with open(self.profiles_path, 'r', encoding='utf-8') as fh:
+                data = json.load(fh)
+        except (OSError, ValueError):
+            data = {}
+        data[name] = {
+            'language': self.lang,
+            'intiface': self.intiface_address,
+            'monitor': self.monitor_index,
+            'multiplier': self.intensity_multiplier,
+            # Devices are stored by name; their index changes from one Intiface session to the next
+            'players': [{'color': p.color_name, 'device': p.device.name} for p in self.players if p.device],
+            'roi': list(self.roi) if self.roi is not None else None,
+        }
+        try:
+            with open(self.profiles_path, 'w', encoding='utf-8') as fh:
+                json.dump(data, fh, indent=2)
+        except OSError:
+            return
+        print(self.MSG.get('profile_saved', "Profile '{name}' saved.").format(name=name))
+
+    def profile_assignments(self, profile):
+        """(color, device name) pairs for setup_players, or None if a profile device is missing."""
+        players = [(p['color'], p['device']) for p in profile.get('players', []) if p.get('color') in DUCK_COLORS]
+        if not players:
             return None
-        
-        best_score_idx = np.argmax(res[loc])
-        x, y = loc[1][best_score_idx], loc[0][best_score_idx]
-        
-        roi_bgr = frame[y:y+self.h, x:x+self.w]
-        roi_hsv = cv2.cvtColor(roi_bgr, cv2.COLOR_BGR2HSV)
-        
-        max_pixels = 0
-        best_color = None
-        min_color_pixels = self.w * self.h * 0.05  # 5% of area
-        
-        for color_name, (lower, upper) in DUCK_COLORS.items():
-            mask = cv2.inRange(roi_hsv, lower, upper)
-            count = cv2.countNonZero(mask)
-            
-            if count > max_pixels:
-                max_pixels = count
-                best_color = color_name
-        
-        return best_color if max_pixels > min_color_pixels else None
+        have = collections.Counter(d.name for d in self.client.devices.values())
+        for name, n in collections.Counter(dev for _, dev in players).items():
+            if have[name] < n:
+                print(self.MSG.get('profile_device_missing', "Device '{dev}' from the profile is not connected; choose the players again.").format(dev=name))
+                return None
+        return players
 
-    def is_intermission(self, frame):
-        if self.intermission_template is None:
-            return False
-        gray_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        res = cv2.matchTemplate(gray_frame, self.intermission_template, cv2.TM_CCOEFF_NORMED)
-        return np.max(res) >= 0.8
+    def set_color_palette(self, palette):
+        # Recompile the color lookup table, e.g. for custom team colors
+        self.color_palette = palette
+        self.detector.color_classifier = ColorClassifier(palette)
+        if self.pool is not None:
+            self.pool.set_palette(palette)
+
+    def detect(self, frame, calibrator=None):
+        # Called from the detection thread with a Frame; must not touch asyncio objects.
+        started = time.perf_counter()
+        detection = None
+        try:
+            if self.pool is not None:
+                try:
+                    detection = self.pool.detect(frame, self.metrics)
+                except (EOFError, OSError) as e:
+                    # A worker died; carry on in-process for the rest of the session
+                    print(self.MSG.get('error_detect_pool', "Detection workers stopped ({err}); continuing in-process.").format(err=e))
+                    self.stop_detection_pool()
+            if detection is None:
+                detection = self.detector.detect(frame, self.metrics)
+            if self.trace is not None and detection.matches:
+                # Before release(): the pixels may live in a ring slot about to be reused
+                self.trace.thumbnail(frame)
+        finally:
+            frame.release()
+
+        detection.intermission = any(detection.seen.get(spec.name) for spec in self.templates.by_event('intermission'))
+        if detection.intermission:
+            # In-round banners are ignored while the intermission screen is up
+            for spec in self.templates.specs:
+                if spec.region == 'roi' and spec.name in detection.seen:
+                    detection.seen[spec.name] = None
+        for spec in self.templates.by_event('plus_one'):
+            detection.color = detection.seen.get(spec.name)
+            if detection.color and calibrator is not None:
+                _, x, y, w, h = detection.matches[spec.name]
+                roi = calibrator.record_match(frame.offset[0] + x, frame.offset[1] + y, w, h, frame.timestamp)
+                if roi is not None:
+                    print(self.MSG.get('roi_calibrated', "Capture region calibrated: {roi}").format(roi=roi))
+            break
+        elapsed = time.perf_counter() - started
+        self.metrics.observe('detect', elapsed)
+        if self.trace is not None:
+            self.trace.frame(detection, elapsed)
+        return detection
+
+    def start_detection_pool(self, monitor):
+        """Start detection worker processes for frames up to the size of monitor; returns the pool or None."""
+        workers = self.detection_workers
+        if workers is None:
+            # Leave one core for capture and the vibration loop; a single-core box stays in-process
+            workers = min(len(self.templates.specs), (os.cpu_count() or 1) - 1)
+        # One worker only adds the copy and pipe round trip to in-process matching
+        if workers < 2 or not self.templates.specs:
+            return None
+        frame_bytes = monitor['width'] * monitor['height'] * 4
+        try:
+            self.pool = DetectionPool(self.templates.specs, self.template_scales, self.color_palette, frame_bytes, workers)
+        except (EOFError, OSError) as e:
+            print(self.MSG.get('error_detect_pool', "Detection workers stopped ({err}); continuing in-process.").format(err=e))
+            return None
+        print(self.MSG.get('detect_pool_started', "Detection running in {n} worker processes.").format(n=len(self.pool.workers)))
+        return self.pool
+
+    def stop_detection_pool(self):
+        pool, self.pool = self.pool, None
+        if pool is not None:
+            pool.close()
+
+    def start_trace(self, path=None):
+        """Start recording the session to path (default trace_path); call after the players are set up."""
+        path = path or self.trace_path
+        players = [{'name': p.name, 'color': p.color_name, 'device': p.device.name if p.device else None}
+                   for p in self.players]
+        # A subscriber has no templates; its events carry template names the trace can't index
+        templates = [spec.name for spec in self.templates.specs] if self.templates is not None else []
+        self.trace = SessionTrace(path, templates, list(self.color_palette), players, thumbnails=self.trace_thumbnails)
+        for p in self.players:
+            p.trace = self.trace
+        if self.dispatcher is not None:
+            self.dispatcher.trace = self.trace
+        print(self.MSG.get('trace_started', "Recording session trace to {path}").format(path=path))
+        return self.trace
+
+    def stop_trace(self):
+        trace, self.trace = self.trace, None
+        if trace is None:
+            return
+        for p in self.players:
+            p.trace = None
+        if self.dispatcher is not None:
+            self.dispatcher.trace = None
+        trace.close()
+        if trace.dropped:
+            print(self.MSG.get('trace_dropped', "Session trace: {n} records dropped (writer fell behind).").format(n=trace.dropped))
 
     def start_vibration_tasks(self):
+        self.dispatcher = DeviceDispatcher(self.max_in_flight, MSG=self.MSG, metrics=self.metrics)
         for p in self.players:
-            t = asyncio.create_task(self._vibration_loop(p))
-            self.vibration_tasks.append(t)
+            if p.device:
+                self.dispatcher.add(p.index, p.name, p.device, self.device_announcements.messages.get(p.device.name))
+        t = asyncio.create_task(self._vibration_loop())
+        self.vibration_tasks.append(t)
+
+    def vibration_tick(self, now):
+        # Hand each device the next sample of its stream; blocks are only rendered when
+        # the current one runs out or the events change
+        started = time.perf_counter()
+        rates = {p.index: self.dispatcher.update_rate(p.index, self.vibration_rate) for p in self.players if p.device}
+        self.waveforms.update(now, rates, self.vibration_freq, self.intensity_multiplier)
+        for player in self.players:
+            if player.device:
+                level = self.waveforms.next_level(player.index, now)
+                if level is not None:
+                    self.dispatcher.submit(player.index, level)
+        self.metrics.observe('schedule', time.perf_counter() - started)
 
-    async def _vibration_loop(self, player):
+    async def _vibration_loop(self):
+        # Single task for all players; the dispatcher sends to the devices concurrently
+        # without blocking this loop
         period = 1.0 / self.vibration_rate
-        freq = self.vibration_freq
-        start_time = time.time()
-        last_sent_zero = False
+        next_tick = time.time()
         while self.running:
             now = time.time()
-            total_amp = 0.0
-            alive_events = []
-            # sum contributions from active events using a smooth cosine envelope
-            for ev in player.vibration_events:
-                t = now - ev['start']
-                if 0.0 <= t <= ev['duration']:
-                    # cosine fade from 1 -> 0 over the duration (smooth)
-                    envelope = 0.5 * (1.0 + math.cos(math.pi * t / ev['duration']))
-                    total_amp += ev['amplitude'] * envelope
-                    alive_events.append(ev)
-            # purge expired events
-            player.vibration_events = alive_events
-
-            # clamp combined amplitude and apply global multiplier
-            total_amp = min(total_amp, 1.0) * self.intensity_multiplier
-
-            if total_amp > 0 and player.device:
-                t = now - start_time
-                sine = (math.sin(2 * math.pi * freq * t) + 1.0) / 2.0  # 0..1
-                level = float(sine * total_amp)
-                try:
-                    await player.device.send_vibrate_cmd(level)
-                except Exception as e:
-                    print(self.MSG.get('error_sending', "Error sending vibrate level to {name}: {err}").format(name=player.name, err=e))
-                last_sent_zero = False
+            # How late this tick is against its deadline (event-loop stalls show up here)
+            self.metrics.observe('tick_lag', max(0.0, now - next_tick))
+            self.vibration_tick(now)
+            next_tick = max(next_tick + period, time.time())
+            await asyncio.sleep(next_tick - time.time())
+
+    async def _metrics_loop(self):
+        loop = asyncio.get_running_loop()
+        while self.running:
+            await asyncio.sleep(self.metrics_interval)
+            try:
+                await loop.run_in_executor(None, self.metrics.dump, self.metrics_dir)
+            except OSError as e:
+                print(self.MSG.get('error_metrics', "Error writing metrics: {err}").format(err=e))
+
+    def make_detection_gate(self):
+        # "Near" = within the coarse search margin of the +1 threshold
+        near = self.plus_one_matcher.coarse_threshold if self.plus_one_matcher is not None else 1.0
+        return DetectionGate(near, self.capture_interval_fast, self.capture_interval, self.capture_interval_idle,
+                             self.capture_interval_intermission, confirm_frames=self.confirm_frames,
+                             clear_frames=self.clear_frames, templates=self.templates.specs)
+
+    async def handle_detection(self, detection):
+        if self.publisher is not None:
+            self.publisher.publish(detection)
+        if self.trace is not None:
+            self.trace.event(detection)
+        # Confirmed events go to the callbacks registered for them (built-in or from templates.json)
+        if not await self.events.dispatch(detection):
+            print(self.MSG.get('detected_event', "Detected {event}.").format(event=detection.event))
+
+    async def on_intermission(self, detection):
+        # Intermission detection: if intermission screen appears, reset all vibrations
+        print(self.MSG.get('intermission_detected', "Intermission detected — resetting vibrations."))
+        for p in self.players:
+            p.set_intensity(0.0, announce=False)
+            p.clear_vibration_events()
+            if p.device and self.dispatcher is not None:
+                self.dispatcher.submit(p.index, 0.0)
+
+    async def on_plus_one(self, detection):
+        winner_color = detection.color
+        if winner_color:
+            print(self.MSG.get('detected_plus_one', "Detected +1 of color {color}!").format(color=winner_color))
+            
+            for player in self.players:
+                if player.color_name == winner_color:
+                    # WON: reduce intensity
+                    await player.update_vibration(-0.2)
+                else:
+                    # LOST: increase intensity and create timed vibration event
+                    new_int = await player.update_vibration(0.1)
+                    if new_int > 0.0:
+                        dur = self.duration_for_intensity(new_int)
+                        player.add_vibration_event(new_int, dur, self.plus_one_waveform)
+                        self.metrics.mark_origin(detection.timestamp)
+
+    def _profile_callback(self, profile):
+        async def callback(detection):
+            await self.apply_vibration_profile(profile, detection)
+        return callback
+
+    async def apply_vibration_profile(self, profile, detection):
+        """Apply a template's vibration profile from templates.json to the players it targets (keys: see README)."""
+        if profile.get('message'):
+            print(profile['message'])
+        targets = profile.get('players', 'all')
+        for player in self.players:
+            if targets == 'winner':
+                selected = player.color_name == detection.color
+            elif targets == 'losers':
+                selected = detection.color is not None and player.color_name != detection.color
+            elif isinstance(targets, list):
+                selected = player.color_name in targets
             else:
-                if player.device and not last_sent_zero:
-                    try:
-                        await player.device.send_stop_device_cmd()
-                    except:
-                        pass
-                    last_sent_zero = True
-            await asyncio.sleep(period)
+                selected = True
+            if not selected:
+                continue
+            if profile.get('intensity'):
+                await player.update_vibration(profile['intensity'])
+            amplitude = profile.get('amplitude')
+            if amplitude:
+                duration = profile.get('duration') or self.duration_for_intensity(amplitude)
+                player.add_vibration_event(amplitude, duration, profile.get('waveform', 'fade'))
+                self.metrics.mark_origin(detection.timestamp)
 
     async def game_loop(self):
         print(self.MSG.get('starting_monitor', "--- STARTING DUCK GAME MONITOR ---"))
         print(self.MSG.get('press_q_exit', "Press 'q' in the console to exit."))
         
         monitor = self.monitor if self.monitor is not None else self.sct.monitors[1]
-        
-        cooldown = False
-        cooldown_timer = 0
-        
+
+        # Capture and matching run in worker threads; we only consume their results here
+        detections = asyncio.Queue(maxsize=8)
+        calibrator = None
+        if self.use_roi and self.template is not None:
+            calibrator = RoiCalibrator(monitor, self.roi_path, (self.w, self.h))
+            if self.recalibrate_roi:
+                calibrator.recalibrate()
+            elif self.roi is not None and not calibrator.set_roi(self.roi):
+                # Keep whatever the calibration file has for this monitor, or calibrate
+                print(self.MSG.get('roi_profile_invalid', "The profile's capture region {roi} does not fit this monitor; ignoring it.").format(roi=tuple(self.roi)))
+            if calibrator.calibrating:
+                print(self.MSG.get('roi_calibrating', "Calibrating capture region: scanning the full screen until a few +1 are seen."))
+            else:
+                print(self.MSG.get('roi_loaded', "Using calibrated capture region: {roi}").format(roi=calibrator.roi))
+        # Template matching fans out over worker processes on multi-core machines; spawning
+        # them and waiting for OpenCV to load in each must not stall the vibration loop
+        await asyncio.get_running_loop().run_in_executor(None, self.start_detection_pool, monitor)
+        if self.trace_path:
+            self.start_trace()
+        if self.publish_address:
+            await self.start_publisher()
+        worker = CaptureWorker(self, monitor, asyncio.get_running_loop(), detections, self.make_detection_gate(), calibrator)
+        worker.start()
+        if self.metrics_dir:
+            self.vibration_tasks.append(asyncio.create_task(self._metrics_loop()))
+
         while self.running:
             if keyboard.is_pressed('q'):
                 self.running = False
                 break
+            if worker.error is not None:
+                print(self.MSG.get('capture_stopped', "Capture stopped after repeated errors ({err}).").format(err=worker.error))
+                self.running = False
+                break
 
-            screenshot = np.array(self.sct.grab(monitor))
-            frame = screenshot[:, :, :3]
-
-            # Intermission detection: if intermission screen appears, reset all vibrations
-            if self.is_intermission(frame):
-                print(self.MSG.get('intermission_detected', "Intermission detected — resetting vibrations."))
-                for p in self.players:
-                    p.intensity = 0.0
-                    p.vibration_events = []
-                    try:
-                        await p.stop_device()
-                    except:
-                        pass
-                # small pause to avoid flapping
-                await asyncio.sleep(0.5)
+            try:
+                detection = await asyncio.wait_for(detections.get(), timeout=0.1)
+            except asyncio.TimeoutError:
                 continue
+            await self.handle_detection(detection)
 
-            if not cooldown:
-                winner_color = self.detect_winner_color(frame)
-                
-                if winner_color:
-                    print(self.MSG.get('detected_plus_one', "Detected +1 of color {color}!").format(color=winner_color))
-                    
-                    for player in self.players:
-                        if player.color_name == winner_color:
-                            # WON: reduce intensity
-                            await player.update_vibration(-0.2)
-                        else:
-                            # LOST: increase intensity and create timed vibration event
-                            new_int = await player.update_vibration(0.1)
-                            if new_int > 0.0:
-                                dur = self.duration_for_intensity(new_int)
-                                player.add_vibration_event(new_int, dur)
-                    
-                    cooldown = True
-                    cooldown_timer = time.time()
-            else:
-                if time.time() - cooldown_timer > 3:
-                    cooldown = False
+        # Shutdown: stop capture, cancel vibration tasks and stop devices
+        print(self.MSG.get('shutting_down', "Shutting down devices..."))
+        await asyncio.get_running_loop().run_in_executor(None, worker.stop)
+        if calibrator is not None and calibrator.roi is not None:
+            self.roi = calibrator.roi
+        self.stop_detection_pool()
+        if self.publisher is not None:
+            await self.publisher.close()
+            self.publisher = None
+        await self.stop_outputs()
 
-            await asyncio.sleep(0.5)
+    async def start_publisher(self, address=None):
+        """Start sending confirmed events to subscribers on address (default publish_address)."""
+        host, port = parse_address(address or self.publish_address, default_host='0.0.0.0')
+        self.publisher = await EventPublisher(host, port, self.event_profiles, self.MSG).start()
+        print(self.MSG.get('publishing', "Publishing events on port {port}.").format(port=self.publisher.port))
+        return self.publisher
+
+    async def subscriber_loop(self, address):
+        """Vibrate the local players for events from a capture host's publisher; no capture or matching here."""
+        print(self.MSG.get('starting_subscriber', "--- RECEIVING DUCK GAME EVENTS ---"))
+        print(self.MSG.get('press_q_exit', "Press 'q' in the console to exit."))
+        # The capture host's templates.json profiles arrive with its hello
+        self.subscriber = EventSubscriber(address, self.handle_detection,
+                                          on_hello=lambda hello: self.set_event_profiles(hello.get('profiles', [])),
+                                          MSG=self.MSG, metrics=self.metrics)
+        task = asyncio.create_task(self.subscriber.run())
+        if self.trace_path:
+            self.start_trace()
+        if self.metrics_dir:
+            self.vibration_tasks.append(asyncio.create_task(self._metrics_loop()))
+
+        while self.running:
+            if keyboard.is_pressed('q'):
+                self.running = False
+                break
+            await asyncio.sleep(0.1)
 
-        # Shutdown: cancel vibration tasks and stop devices
         print(self.MSG.get('shutting_down', "Shutting down devices..."))
+        self.subscriber.close()
+        task.cancel()
+        await self.stop_outputs()
+
+    async def stop_outputs(self):
+        """Cancel the vibration tasks, flush the dispatcher, trace and metrics, and stop the devices."""
         for t in self.vibration_tasks:
             t.cancel()
+        if self.dispatcher is not None:
+            await self.dispatcher.drain()
+            self.dispatcher.report()
+        self.stop_trace()
+        if self.metrics_dir:
+            try:
+                self.metrics.dump(self.metrics_dir)
+            except OSError as e:
+                print(self.MSG.get('error_metrics', "Error writing metrics: {err}").format(err=e))
         for p in self.players:
             try:
                 await p.stop_device()
             except:
                 pass
 
-if __name__ == "__main__":
-    game = DuckHaptics()
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="DuckSense: haptic feedback for Duck Game events.")
+    parser.add_argument('--profile', help="start from this saved profile; only settings it lacks are asked for")
+    parser.add_argument('--save-profile', metavar='NAME', help="save this session's setup (and, on exit, the learned capture region) as NAME")
+    parser.add_argument('--lang', choices=('en', 'es'))
+    parser.add_argument('--monitor', type=int, help="monitor index as listed by mss (1 = main monitor)")
+    parser.add_argument('--multiplier', type=float, help="global intensity multiplier (0.0 to 1.0)")
+    parser.add_argument('--intiface', metavar='URL', help="Intiface server address (default ws://127.0.0.1:12345)")
+    parser.add_argument('--scan-time', type=float, help="longest device scan in seconds (default 2)")
+    parser.add_argument('--calibrate', action='store_true', help="learn the capture region again")
+    parser.add_argument('--no-roi', action='store_true', help="always capture the full screen")
+    parser.add_argument('--workers', type=int, help="detection worker processes (0 = in-process)")
+    parser.add_argument('--metrics', metavar='DIR', help="write latency metrics to DIR")
+    parser.add_argument('--publish', metavar='[HOST:]PORT', help="send detected events to subscribers on this port (e.g. 12346)")
+    parser.add_argument('--subscribe', metavar='HOST[:PORT]', help="no capture: vibrate for the events published by HOST")
+    parser.add_argument('--trace', metavar='PATH', help="record a binary session trace to PATH (see trace_tool.py)")
+    parser.add_argument('--trace-thumbnails', action='store_true', help="also store small JPEGs of frames with matches")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    # OpenCV, mss, keyboard and buttplug import in the background while the profile is read
+    preload_modules((buttplug_client, keyboard) if args.subscribe else (buttplug_client, cv2, mss, keyboard))
+    game = DuckHaptics(defer_templates=True)
+    profile = game.load_profile(args.profile) if args.profile else None
     # Ask language first so prompts are shown in the selected language
-    game.set_language()
+    game.set_language(args.lang or (profile or {}).get('language'))
+    if args.profile:
+        if profile is None:
+            print(game.MSG.get('profile_not_found', "Profile '{name}' not found in {path}.").format(name=args.profile, path=game.profiles_path))
+        else:
+            print(game.MSG.get('profile_loaded', "Using profile '{name}'.").format(name=args.profile))
+    profile = profile or {}
+
+    game.intiface_address = args.intiface or profile.get('intiface') or game.intiface_address
+    if args.scan_time is not None:
+        game.scan_time = args.scan_time
+    game.recalibrate_roi = args.calibrate
+    game.use_roi = not args.no_roi
+    game.detection_workers = args.workers
+    game.metrics_dir = args.metrics
+    game.trace_path = args.trace
+    game.publish_address = args.publish
+    game.trace_thumbnails = args.trace_thumbnails
+    wanted = [p.get('device') for p in profile.get('players', [])]
 
-    loop = asyncio.get_event_loop()
-    # Connect to Intiface and configure settings
-    if loop.run_until_complete(game.connect_intiface()):
-        game.configure_settings()
-        loop.run_until_complete(game.setup_players())
-        loop.run_until_complete(game.game_loop())
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    multiplier = args.multiplier if args.multiplier is not None else profile.get('multiplier')
+    if args.subscribe:
+        # A subscriber never captures: no templates, no OpenCV
+        connected = loop.run_until_complete(game.connect_intiface(wanted))
+    else:
+        # Templates load in a thread while Intiface connects and scanning waits for the profile's devices
+        connected, _ = loop.run_until_complete(asyncio.gather(
+            game.connect_intiface(wanted), loop.run_in_executor(None, game.load_templates)))
+    # A capture host that only publishes needs no toys of its own
+    if connected or (args.publish and not args.subscribe):
+        if args.subscribe:
+            game.configure_multiplier(multiplier)
+        else:
+            game.configure_settings(args.monitor if args.monitor is not None else profile.get('monitor'), multiplier)
+            # A capture region only means something on the monitor it was learned on
+            if profile.get('roi') and profile.get('monitor') == game.monitor_index:
+                game.roi = tuple(profile['roi'])
+        if connected:
+            loop.run_until_complete(game.setup_players(game.profile_assignments(profile) if profile else None))
+        if args.save_profile:
+            game.save_profile(args.save_profile)
+        loop.run_until_complete(game.subscriber_loop(args.subscribe) if args.subscribe else game.game_loop())
+        if args.save_profile:
+            game.save_profile(args.save_profile)
 
     print(game.MSG.get('program_finished', "Program finished."))
+
+if __name__ == "__main__":
+    # Detection workers are spawned processes; needed when frozen with PyInstaller
+    multiprocessing.freeze_support()
+    main()
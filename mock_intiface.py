@@ -0,0 +1,252 @@
+"""Stand-in for Intiface Central: a Buttplug websocket server with simulated devices.
+
+Speaks the subset of the Buttplug v1 JSON protocol that DuckSense uses through
+buttplug-py (RequestServerInfo, RequestDeviceList, StartScanning/StopScanning,
+VibrateCmd, StopDeviceCmd, StopAllDevices, Ping) and simulates any number of
+vibrators. Every command waits `latency` ± `jitter` seconds (commands to one
+device are handled one at a time, like a Bluetooth link) and fails with a
+device error with probability `failure_rate`. No toys or Intiface install needed.
+
+Usage:
+    python mock_intiface.py --devices 8 --latency 20 --jitter 10 --failure-rate 0.01
+    python main.py   # then connect to ws://127.0.0.1:12345 as usual
+
+By default devices are in the initial device list; with --scan-delay they only
+show up (one DeviceAdded each) that many seconds after scanning starts.
+"""
+import argparse
+import asyncio
+import json
+import random
+import threading
+import time
+
+import websockets
+
+ERROR_UNKNOWN = 0
+ERROR_MSG = 3
+ERROR_DEVICE = 4
+
+
+class SimulatedDevice:
+    """One simulated vibrator and the commands it received."""
+    def __init__(self, index, name, features=1, steps=20):
+        self.index = index
+        self.name = name
+        self.features = features
+        self.steps = steps
+        self.levels = [0.0] * features
+        self.commands = 0
+        self.failures = 0
+        self.history = []  # (time.time(), level of motor 0) for the last max_history commands
+        self.max_history = 10000
+        self.lock = asyncio.Lock()
+
+    def info(self):
+        return {
+            'DeviceName': self.name,
+            'DeviceIndex': self.index,
+            'DeviceMessages': {
+                'VibrateCmd': {'FeatureCount': self.features, 'StepCount': [self.steps] * self.features},
+                'StopDeviceCmd': {},
+            },
+        }
+
+    def apply(self, speeds):
+        for index, speed in speeds:
+            if 0 <= index < self.features:
+                self.levels[index] = min(1.0, max(0.0, float(speed)))
+        self.commands += 1
+        self.history.append((time.time(), self.levels[0]))
+        if len(self.history) > self.max_history:
+            del self.history[:len(self.history) - self.max_history]
+
+
+class MockIntifaceServer:
+    """Buttplug v1 websocket server simulating `devices` vibrators.
+
+    latency and jitter are in seconds; the command delay is drawn uniformly
+    from latency ± jitter (never below zero). failure_rate is the probability a
+    device command is answered with an Error instead of Ok. port=0 picks a free
+    port (see `address` after start()).
+    """
+    def __init__(self, devices=1, host='127.0.0.1', port=12345, latency=0.0, jitter=0.0,
+                 failure_rate=0.0, scan_delay=None, steps=20, seed=None, name="Mock Intiface"):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.scan_delay = scan_delay
+        self.name = name
+        self.random = random.Random(seed)
+        self.devices = [SimulatedDevice(i, f"Mock Vibrator {i + 1}", steps=steps) for i in range(devices)]
+        self.clients = 0
+        self._server = None
+        self._listed = set() if scan_delay is not None else {d.index for d in self.devices}
+
+    @property
+    def address(self):
+        return f"ws://{self.host}:{self.port}"
+
+    async def start(self):
+        self._server = await websockets.serve(self._serve, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    def stats(self):
+        return {d.name: {'commands': d.commands, 'failures': d.failures, 'level': d.levels[0]} for d in self.devices}
+
+    def _delay(self):
+        return max(0.0, self.latency + self.random.uniform(-self.jitter, self.jitter))
+
+    async def _serve(self, ws):
+        self.clients += 1
+        tasks = set()
+        try:
+            async for text in ws:
+                try:
+                    messages = json.loads(text)
+                except ValueError:
+                    await self._send(ws, 'Error', ERROR_MSG, ErrorMessage="Invalid JSON", ErrorCode=ERROR_MSG)
+                    continue
+                for message in messages:
+                    (kind, body), = message.items()
+                    # Device commands run concurrently so a slow device never stalls the others
+                    task = asyncio.create_task(self._handle(ws, kind, body))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            for task in tasks:
+                task.cancel()
+            self.clients -= 1
+
+    async def _send(self, ws, kind, msg_id, **fields):
+        fields['Id'] = msg_id
+        try:
+            await ws.send(json.dumps([{kind: fields}]))
+        except websockets.ConnectionClosed:
+            pass
+
+    async def _handle(self, ws, kind, body):
+        msg_id = body.get('Id', 0)
+        if kind == 'RequestServerInfo':
+            await self._send(ws, 'ServerInfo', msg_id, ServerName=self.name, MajorVersion=0, MinorVersion=0,
+                             BuildVersion=0, MessageVersion=1, MaxPingTime=0)
+        elif kind == 'RequestDeviceList':
+            devices = [d.info() for d in self.devices if d.index in self._listed]
+            await self._send(ws, 'DeviceList', msg_id, Devices=devices)
+        elif kind == 'StartScanning':
+            await self._send(ws, 'Ok', msg_id)
+            await self._announce(ws)
+        elif kind in ('StopScanning', 'Ping', 'RequestLog'):
+            await self._send(ws, 'Ok', msg_id)
+        elif kind == 'StopAllDevices':
+            for device in self.devices:
+                device.apply([(i, 0.0) for i in range(device.features)])
+            await self._send(ws, 'Ok', msg_id)
+        elif kind in ('VibrateCmd', 'StopDeviceCmd'):
+            index = body.get('DeviceIndex')
+            if index is None or not 0 <= index < len(self.devices) or index not in self._listed:
+                await self._send(ws, 'Error', msg_id, ErrorMessage=f"Unknown device {index}", ErrorCode=ERROR_DEVICE)
+                return
+            device = self.devices[index]
+            async with device.lock:
+                await asyncio.sleep(self._delay())
+                if self.random.random() < self.failure_rate:
+                    device.failures += 1
+                    await self._send(ws, 'Error', msg_id, ErrorMessage="Simulated device failure", ErrorCode=ERROR_DEVICE)
+                    return
+                if kind == 'VibrateCmd':
+                    device.apply([(s['Index'], s['Speed']) for s in body.get('Speeds', [])])
+                else:
+                    device.apply([(i, 0.0) for i in range(device.features)])
+            await self._send(ws, 'Ok', msg_id)
+        else:
+            await self._send(ws, 'Error', msg_id, ErrorMessage=f"Unsupported message {kind}", ErrorCode=ERROR_MSG)
+
+    async def _announce(self, ws):
+        # Devices found "while scanning" arrive one by one after scan_delay
+        if self.scan_delay is None:
+            return
+        await asyncio.sleep(self.scan_delay)
+        for device in self.devices:
+            if device.index not in self._listed:
+                self._listed.add(device.index)
+                await self._send(ws, 'DeviceAdded', 0, DeviceName=device.name, DeviceIndex=device.index,
+                                 DeviceMessages=device.info()['DeviceMessages'])
+
+
+class ServerThread:
+    """Runs a MockIntifaceServer on its own event loop in a background thread.
+
+    Keeps the simulated devices' work off the loop under test, so a load test
+    measures the client's event loop and nothing else.
+    """
+    def __init__(self, server):
+        self.server = server
+        self.loop = asyncio.new_event_loop()
+        self._ready = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="mock-intiface", daemon=True)
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_until_complete(self.server.start())
+        self._ready.set()
+        self.loop.run_forever()
+
+    def start(self):
+        self._thread.start()
+        self._ready.wait()
+        return self.server
+
+    def stop(self):
+        asyncio.run_coroutine_threadsafe(self.server.stop(), self.loop).result(timeout=5)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join(timeout=5)
+        self.loop.close()
+
+
+async def _run_forever(server):
+    await server.start()
+    print(f"Mock Intiface listening on {server.address} with {len(server.devices)} device(s) "
+          f"(latency {server.latency * 1000:.0f}±{server.jitter * 1000:.0f} ms, failure rate {server.failure_rate:.2%})")
+    try:
+        while True:
+            await asyncio.sleep(10)
+            counts = ", ".join(f"{name}: {st['commands']}" for name, st in server.stats().items())
+            print(f"[{server.clients} client(s)] commands {counts}")
+    finally:
+        await server.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulated Intiface Central (Buttplug v1 websocket server).")
+    parser.add_argument('--devices', type=int, default=2, help="number of simulated vibrators (default 2)")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=12345)
+    parser.add_argument('--latency', type=float, default=10.0, help="command latency in ms (default 10)")
+    parser.add_argument('--jitter', type=float, default=0.0, help="± latency jitter in ms")
+    parser.add_argument('--failure-rate', type=float, default=0.0, help="probability a command fails (0-1)")
+    parser.add_argument('--scan-delay', type=float, help="devices appear this many seconds after scanning starts")
+    parser.add_argument('--steps', type=int, default=20, help="vibration steps reported per motor")
+    parser.add_argument('--seed', type=int)
+    args = parser.parse_args()
+    server = MockIntifaceServer(args.devices, args.host, args.port, args.latency / 1000.0, args.jitter / 1000.0,
+                                args.failure_rate, args.scan_delay, args.steps, args.seed)
+    try:
+        asyncio.run(_run_forever(server))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
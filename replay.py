@@ -0,0 +1,292 @@
+"""Offline replay and benchmark for the DuckSense detection pipeline.
+
+Feeds a recorded video or a directory of PNG frames through the same path as
+DuckHaptics.game_loop (ROI calibration, detect(), the DetectionGate,
+handle_detection(), the vibration scheduler and the dispatcher) with mock devices that record every
+command. No screen, Intiface or keyboard is needed, so it runs on a headless box.
+
+Ground truth is a CSV with one row per labeled frame: `frame,label`, where frame
+is the PNG file name (directory input) or the frame index (video input) and label
+is a duck color name, `intermission`, or empty for "nothing on screen". Frames
+without a row count as empty. By default `labels.csv` inside the directory, or
+`<video>.csv` next to the video, is used.
+
+Usage:
+    python replay.py recordings/round1/ --players yellow,pink --repeat 5 --json bench.json
+"""
+import argparse
+import asyncio
+import contextlib
+import csv
+import io
+import json
+import os
+import statistics
+import sys
+import time
+
+import cv2
+import numpy as np
+
+from main import DUCK_COLORS, DuckHaptics, Frame, Player, RoiCalibrator
+
+
+class MockDevice:
+    """Stand-in for ButtplugClientDevice that records the commands it receives."""
+    def __init__(self, name, clock, steps=20):
+        self.name = name
+        self.clock = clock
+        self.allowed_messages = {'VibrateCmd': _Attributes(steps)}
+        self.commands = []  # (time, level) with level None for a stop command
+
+    async def send_vibrate_cmd(self, speeds):
+        self.commands.append((self.clock(), float(speeds)))
+
+    async def send_stop_device_cmd(self):
+        self.commands.append((self.clock(), None))
+
+
+class _Attributes:
+    def __init__(self, steps):
+        self.feature_count = 1
+        self.step_count = steps
+
+
+def load_frames(source):
+    """Return [(frame id, BGRA image)] from a video file or a directory of PNGs."""
+    frames = []
+    if os.path.isdir(source):
+        for name in sorted(os.listdir(source)):
+            if name.lower().endswith('.png'):
+                image = cv2.imread(os.path.join(source, name), cv2.IMREAD_COLOR)
+                if image is not None:
+                    frames.append((name, cv2.cvtColor(image, cv2.COLOR_BGR2BGRA)))
+    else:
+        cap = cv2.VideoCapture(source)
+        index = 0
+        while True:
+            ok, image = cap.read()
+            if not ok:
+                break
+            frames.append((str(index), cv2.cvtColor(image, cv2.COLOR_BGR2BGRA)))
+            index += 1
+        cap.release()
+    return frames
+
+
+def default_labels_path(source):
+    if os.path.isdir(source):
+        return os.path.join(source, 'labels.csv')
+    return os.path.splitext(source)[0] + '.csv'
+
+
+def load_labels(path):
+    labels = {}
+    if path is None or not os.path.exists(path):
+        return labels
+    with open(path, newline='', encoding='utf-8') as fh:
+        for row in csv.reader(fh):
+            if not row or row[0].strip().lower() == 'frame':
+                continue
+            labels[row[0].strip()] = row[1].strip().lower() if len(row) > 1 else ''
+    return labels
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    return float(np.percentile(np.asarray(values), pct))
+
+
+async def replay_once(frames, labels, colors, fps, use_roi, verbose, workers=0):
+    now = [0.0]
+    clock = lambda: now[0]
+
+    game = DuckHaptics()
+    game.scheduler.clock = clock
+    game.metrics.clock = clock
+    game.scheduler.carrier_start = 0.0
+    for i, color in enumerate(colors):
+        device = MockDevice(f"mock-{i+1}-{color}", clock)
+        game.players.append(Player(f"P{i+1}", color, device, game.MSG, game.scheduler, i))
+    game.start_vibration_tasks()
+    # start_vibration_tasks launched the real-time loop; replay drives ticks itself
+    for t in game.vibration_tasks:
+        t.cancel()
+    game.dispatcher.started = time.time()
+
+    height, width = frames[0][1].shape[:2]
+    monitor = {'left': 0, 'top': 0, 'width': width, 'height': height}
+    calibrator = RoiCalibrator(monitor, None, (game.w, game.h)) if use_roi and game.template is not None else None
+
+    game.detection_workers = workers
+
+    gate = game.make_detection_gate()
+    intermission = game.templates.by_event('intermission')
+    events = []
+    frame_period = 1.0 / fps
+    tick_period = 1.0 / game.vibration_rate
+    next_tick = 0.0
+    latencies = []
+    predictions = []
+    quiet = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO())
+    try:
+        with quiet:
+            if workers:
+                game.start_detection_pool(monitor)
+            for index, (frame_id, image) in enumerate(frames):
+                now[0] = index * frame_period
+                # "Grab": crop to whatever region the calibrator would capture
+                if calibrator is not None:
+                    _, (x, y), is_full = calibrator.next_region(now[0], gate.mode == 'intermission')
+                    if not is_full:
+                        rx, ry, rw, rh = calibrator.roi
+                        image = np.ascontiguousarray(image[ry:ry + rh, rx:rx + rw])
+                else:
+                    x, y, is_full = 0, 0, True
+                frame = Frame(image, now[0], (x, y), is_full)
+
+                started = time.perf_counter()
+                detection = game.detect(frame, calibrator)
+                latencies.append(time.perf_counter() - started)
+
+                predicted = 'intermission' if detection.intermission else (detection.color or '')
+                # Intermission is only searched on full frames (every couple of seconds with an ROI);
+                # frames where it wasn't looked for say nothing about it
+                skipped = set() if any(spec.name in detection.seen for spec in intermission) else {'intermission'}
+                predictions.append((frame_id, predicted, skipped))
+                # Recorded frames keep their own rate, so the gate's poll interval is ignored here
+                confirmed, _ = gate.update(detection)
+                for event in confirmed:
+                    # +1 events are counted per color, every other template by its event name
+                    events.append(event.color if event.event == 'plus_one' else event.event)
+                    await game.handle_detection(event)
+
+                # Vibration ticks that fall before the next frame, in simulated time
+                frame_end = now[0] + frame_period
+                while next_tick < frame_end:
+                    now[0] = next_tick
+                    game.vibration_tick(next_tick)
+                    await game.dispatcher.drain()
+                    next_tick += tick_period
+    finally:
+        game.stop_detection_pool()
+
+    return game, latencies, predictions, events
+
+
+def score(predictions, labels, classes):
+    """Per-class precision/recall over the frames where the class was looked for."""
+    per_class = {}
+    for name in classes:
+        tp = fp = fn = checked = 0
+        for frame_id, predicted, skipped in predictions:
+            if name in skipped:
+                continue
+            checked += 1
+            truth = labels.get(frame_id, '')
+            if predicted == name and truth == name:
+                tp += 1
+            elif predicted == name:
+                fp += 1
+            elif truth == name:
+                fn += 1
+        per_class[name] = {
+            'frames': checked, 'tp': tp, 'fp': fp, 'fn': fn,
+            'precision': tp / (tp + fp) if tp + fp else None,
+            'recall': tp / (tp + fn) if tp + fn else None,
+        }
+    return per_class
+
+
+def command_counts(game):
+    counts = {}
+    for player in game.players:
+        cmds = player.device.commands
+        counts[player.device.name] = {
+            'vibrate': sum(1 for _, level in cmds if level is not None),
+            'stop': sum(1 for _, level in cmds if level is None),
+        }
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded frames through the DuckSense detection pipeline.")
+    parser.add_argument('source', help="video file or directory of PNG frames")
+    parser.add_argument('--labels', help="ground truth CSV (frame,label); default labels.csv / <video>.csv")
+    parser.add_argument('--fps', type=float, default=2.0, help="capture rate the frames were recorded at (default 2)")
+    parser.add_argument('--players', default='yellow,pink', help="comma separated duck colors, one mock device each")
+    parser.add_argument('--repeat', type=int, default=3, help="benchmark runs; the first also produces accuracy numbers")
+    parser.add_argument('--no-roi', action='store_true', help="always match the full frame")
+    parser.add_argument('--workers', type=int, default=0, help="detection worker processes (default 0 = in-process)")
+    parser.add_argument('--json', help="write the report as JSON to this file")
+    parser.add_argument('--verbose', action='store_true', help="show the program's own console output")
+    args = parser.parse_args()
+
+    frames = load_frames(args.source)
+    if not frames:
+        print(f"No frames found in {args.source}")
+        return 1
+    labels = load_labels(args.labels or default_labels_path(args.source))
+    colors = [c.strip() for c in args.players.split(',') if c.strip()]
+    unknown = [c for c in colors if c not in DUCK_COLORS]
+    if unknown:
+        print(f"Unknown colors: {', '.join(unknown)} (available: {', '.join(DUCK_COLORS)})")
+        return 1
+
+    runs = []
+    first = None
+    for _ in range(max(1, args.repeat)):
+        game, latencies, predictions, events = asyncio.run(replay_once(frames, labels, colors, args.fps, not args.no_roi, args.verbose, args.workers))
+        runs.append(latencies)
+        if first is None:
+            first = (game, predictions, events)
+
+    game, predictions, events = first
+    all_latencies = [v for run in runs for v in run]
+    fps_per_run = [len(run) / sum(run) if sum(run) else 0.0 for run in runs]
+    report = {
+        'source': args.source,
+        'workers': args.workers,
+        'frames': len(frames),
+        'runs': len(runs),
+        'fps': {'median': statistics.median(fps_per_run), 'best': max(fps_per_run)},
+        'latency_ms': {p: percentile(all_latencies, int(p[1:])) * 1000.0 for p in ('p50', 'p90', 'p99')},
+        'accuracy': score(predictions, labels, list(DUCK_COLORS) + ['intermission']) if labels else None,
+        'events': {name: events.count(name) for name in sorted(set(events))},
+        'commands': command_counts(game),
+        'stages': game.metrics.summary(),
+    }
+    report['latency_ms']['max'] = max(all_latencies) * 1000.0
+
+    print(f"Frames: {report['frames']} x {report['runs']} runs")
+    print(f"Throughput: {report['fps']['median']:.1f} fps median, {report['fps']['best']:.1f} fps best")
+    lat = report['latency_ms']
+    print(f"Latency: p50 {lat['p50']:.2f} ms, p90 {lat['p90']:.2f} ms, p99 {lat['p99']:.2f} ms, max {lat['max']:.2f} ms")
+    if report['accuracy'] is None:
+        print("Accuracy: no labels found")
+    else:
+        print("Accuracy:")
+        for name, st in report['accuracy'].items():
+            if st['tp'] + st['fp'] + st['fn'] == 0:
+                continue
+            precision = '-' if st['precision'] is None else f"{st['precision']:.3f}"
+            recall = '-' if st['recall'] is None else f"{st['recall']:.3f}"
+            print(f"  {name:<13} precision {precision}  recall {recall}  (tp {st['tp']}, fp {st['fp']}, fn {st['fn']}"
+                  f" on {st['frames']} frames)")
+    print("Confirmed events: " + (", ".join(f"{name} x{n}" for name, n in report['events'].items()) or "none"))
+    print("Stages (first run; end_to_end is in simulated time):")
+    for stage, st in report['stages'].items():
+        print(f"  {stage:<20} n={st['count']:<6} mean {st['mean_ms']:.3f} ms  p90 {st['p90_ms']:.3f} ms  max {st['max_ms']:.3f} ms")
+    print("Commands:")
+    for name, counts in report['commands'].items():
+        print(f"  {name}: {counts['vibrate']} vibrate, {counts['stop']} stop")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as fh:
+            json.dump(report, fh, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
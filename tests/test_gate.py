@@ -0,0 +1,71 @@
+import numpy as np
+
+from main import Debouncer, Detection, DetectionGate, TemplateSpec
+
+
+def test_debouncer_confirms_once_and_clears():
+    debouncer = Debouncer(confirm_frames=2, clear_frames=3)
+    assert debouncer.update('pink') is None
+    assert debouncer.pending
+    assert debouncer.update('pink') == 'pink'
+    # Latched: the banner staying on screen is not counted again
+    assert debouncer.update('pink') is None
+    for _ in range(2):
+        assert debouncer.update(None) is None
+    assert debouncer.latched == 'pink'
+    debouncer.update(None)
+    assert debouncer.latched is None
+    assert debouncer.update('pink') is None
+    assert debouncer.update('pink') == 'pink'
+
+
+def test_debouncer_needs_consecutive_equal_values():
+    debouncer = Debouncer(confirm_frames=2)
+    assert debouncer.update('pink') is None
+    assert debouncer.update('yellow') is None
+    assert debouncer.update(None) is None
+    assert debouncer.update('yellow') is None
+    assert debouncer.update('yellow') == 'yellow'
+
+
+def make_gate(**kwargs):
+    image = np.zeros((8, 8), np.uint8)
+    specs = [
+        TemplateSpec('plus_one', image, event='plus_one', region='roi', classify_color=True),
+        TemplateSpec('intermission', image, event='intermission'),
+    ]
+    return DetectionGate(0.6, templates=specs, **kwargs)
+
+
+def frame(t, **seen):
+    detection = Detection(t)
+    detection.seen = seen
+    return detection
+
+
+def test_gate_emits_plus_one_after_confirmation():
+    gate = make_gate(confirm_frames=2)
+    events, _ = gate.update(frame(0.0, plus_one='yellow'))
+    assert events == []
+    events, interval = gate.update(frame(0.1, plus_one='yellow'))
+    assert [(e.event, e.color, e.template) for e in events] == [('plus_one', 'yellow', 'plus_one')]
+    assert gate.mode == 'fast' and interval == gate.intervals['fast']
+
+
+def test_gate_ignores_other_templates_during_intermission():
+    gate = make_gate(confirm_frames=2)
+    events, interval = gate.update(frame(0.0, intermission=True, plus_one='pink'))
+    assert [e.event for e in events] == ['intermission']
+    assert events[0].intermission
+    assert gate.mode == 'intermission' and interval == gate.intervals['intermission']
+    events, _ = gate.update(frame(0.1, intermission=True, plus_one='pink'))
+    assert events == []
+
+
+def test_gate_goes_idle_without_changes():
+    gate = make_gate(idle_after=1.0)
+    gate.update(frame(0.0))
+    detection = frame(2.0)
+    detection.changed = False
+    _, interval = gate.update(detection)
+    assert gate.mode == 'idle' and interval == gate.intervals['idle']
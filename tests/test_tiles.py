@@ -0,0 +1,48 @@
+import numpy as np
+
+from main import TileChangeTracker
+
+
+def test_first_frame_is_new_and_static_frames_are_clean():
+    tracker = TileChangeTracker()
+    frame = np.full((256, 256), 100, np.uint8)
+    assert tracker.update(frame, 'full') is None
+    assert tracker.update(frame, 'full') == []
+
+
+def test_geometry_keys_are_tracked_separately():
+    tracker = TileChangeTracker()
+    tracker.update(np.zeros((256, 256), np.uint8), 'full')
+    assert tracker.update(np.zeros((128, 128), np.uint8), 'roi') is None
+    assert tracker.update(np.zeros((256, 256), np.uint8), 'full') == []
+
+
+def test_change_is_reported_as_tile_rectangle():
+    tracker = TileChangeTracker()
+    frame = np.full((256, 256), 100, np.uint8)
+    tracker.update(frame, 'full')
+    frame[70:80, 140:150] = 200
+    assert tracker.update(frame, 'full') == [(128, 64, 192, 128)]
+    assert tracker.update(frame, 'full') == []
+
+
+def test_slow_fade_still_marks_tile_dirty():
+    tracker = TileChangeTracker(threshold=6)
+    frame = np.full((256, 256), 100, np.uint8)
+    tracker.update(frame, 'full')
+    reports = []
+    for level in range(101, 121):  # one gray level per frame
+        frame[0:64, 0:64] = level
+        reports.append(tracker.update(frame, 'full'))
+    dirty = [r for r in reports if r]
+    assert dirty and all(r == [(0, 0, 64, 64)] for r in dirty)
+    # Each report resets the reference, so the fade is reported in steps, not every frame
+    assert len(dirty) == 20 // 7
+
+
+def test_partial_edge_cells_are_tracked():
+    tracker = TileChangeTracker()
+    frame = np.full((70, 130), 100, np.uint8)  # 2 px and 6 px past the last whole cell
+    tracker.update(frame, 'full')
+    frame[68:70, 128:130] = 255
+    assert tracker.update(frame, 'full') == [(128, 64, 130, 70)]
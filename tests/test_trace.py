@@ -0,0 +1,33 @@
+from main import Detection, SessionTrace
+from trace_tool import TraceFile
+
+
+def test_session_trace_round_trip(tmp_path):
+    path = str(tmp_path / 'session.trace')
+    trace = SessionTrace(path, templates=['plus_one', 'intermission'], colors=['yellow', 'pink'],
+                         players=[{'name': 'P1'}])
+    detection = Detection(12.5, color='pink')
+    detection.matches = {'plus_one': (0.9, 10, 20, 30, 40)}
+    detection.score = 0.9
+    trace.frame(detection, 0.004)
+    trace.event(Detection(12.5, color='pink', event='plus_one', template='plus_one'))
+    trace.record(SessionTrace.INTENSITY, 13.0, 0, a=0.2, b=0.1)
+    trace.close()
+    assert trace.dropped == 0
+
+    reader = TraceFile(path)
+    try:
+        assert reader.templates == ['plus_one', 'intermission']
+        assert reader.player(0) == 'P1'
+        kinds = [int(k) for k in reader.records['kind']]
+        assert kinds == [SessionTrace.FRAME, SessionTrace.MATCH, SessionTrace.EVENT, SessionTrace.INTENSITY]
+        frame, match, event, intensity = reader.records
+        assert frame['t'] == 12.5 and reader.color(frame['player']) == 'pink'
+        assert frame['code'] == 3 and frame['i'] == 1  # full + changed, one match
+        assert abs(frame['a'] - 4.0) < 1e-4
+        assert reader.template(match['code']) == 'plus_one'
+        assert (match['i'], match['j'], match['b'], match['c']) == (10, 20, 30, 40)
+        assert reader.template(event['code']) == 'plus_one'
+        assert abs(intensity['a'] - 0.2) < 1e-6 and intensity['player'] == 0
+    finally:
+        reader.close()
@@ -0,0 +1,54 @@
+import numpy as np
+
+from main import VibrationScheduler, WAVEFORM_INDEX, WaveformEngine
+
+
+def make_scheduler():
+    scheduler = VibrationScheduler(capacity=2, clock=lambda: 0.0)
+    scheduler.carrier_start = 0.0
+    return scheduler
+
+
+def envelope(levels, times, freq):
+    # Undo the 0..1 sine carrier shared by all players
+    sine = (np.sin(2 * np.pi * freq * times) + 1.0) / 2.0
+    return levels / sine
+
+
+def test_fade_event_envelope_per_player():
+    scheduler = make_scheduler()
+    scheduler.add(1, 0.8, 2.0, start=1.0)
+    times = np.array([0.5, 1.0, 2.0, 3.5])
+    levels = scheduler.render(times, 2, freq=0.1)
+    assert levels.shape == (2, 4)
+    assert np.all(levels[0] == 0.0)
+    np.testing.assert_allclose(envelope(levels[1], times, 0.1), [0.0, 0.8, 0.4, 0.0], atol=1e-9)
+
+
+def test_overlapping_events_are_clamped_and_scaled():
+    scheduler = make_scheduler()
+    scheduler.add(0, 0.7, 10.0, start=0.0, waveform=WAVEFORM_INDEX['pulse'])
+    scheduler.add(0, 0.7, 10.0, start=0.0, waveform=WAVEFORM_INDEX['pulse'])
+    scheduler.add(0, 0.7, 10.0, start=0.0, waveform=WAVEFORM_INDEX['pulse'])  # grows past capacity
+    times = np.array([0.1])
+    levels = scheduler.render(times, 1, freq=1.0, multiplier=0.5)
+    np.testing.assert_allclose(envelope(levels[0], times, 1.0), [0.5])
+
+
+def test_expired_events_are_purged_and_clear_bumps_version():
+    scheduler = make_scheduler()
+    scheduler.add(0, 1.0, 1.0, start=0.0)
+    scheduler.add(1, 1.0, 10.0, start=0.0)
+    scheduler.render(np.array([5.0]), 2, freq=1.0)
+    assert scheduler.count == 1 and scheduler.player[0] == 1
+    version = scheduler.version
+    scheduler.clear(1)
+    assert scheduler.count == 0 and scheduler.version > version
+
+
+def test_engine_rerenders_when_a_device_rate_changes():
+    engine = WaveformEngine(make_scheduler())
+    engine.update(0.0, {0: 20}, 1.0)
+    assert engine.streams[0][1] == 20
+    engine.update(0.1, {0: 10}, 1.0)
+    assert engine.streams[0][1] == 10
@@ -0,0 +1,233 @@
+"""Inspect a DuckSense session trace (python main.py --trace session.trace).
+
+The log is memory-mapped and viewed as a numpy structured array
+(SessionTrace.DTYPE), so even hours of records load instantly and every
+summary is a vectorized pass over one column.
+
+Usage:
+    python trace_tool.py summary session.trace
+    python trace_tool.py replay session.trace --from 120 --to 135 --kinds frame,event,level --speed 1
+    python trace_tool.py thumbs session.trace out_dir/
+"""
+import argparse
+import json
+import mmap
+import os
+import struct
+import sys
+import time
+
+import numpy as np
+
+from main import SessionTrace
+
+
+class TraceFile:
+    """A session trace opened read-only: header (dict) and records (numpy view of the mapped file)."""
+    def __init__(self, path):
+        self.path = path
+        self._fh = open(path, 'rb')
+        self._mm = mmap.mmap(self._fh.fileno(), 0, access=mmap.ACCESS_READ)
+        magic = self._mm[:len(SessionTrace.MAGIC)]
+        if magic != SessionTrace.MAGIC:
+            raise ValueError(f"{path} is not a DuckSense session trace")
+        start = len(SessionTrace.MAGIC) + 4
+        (length,) = struct.unpack_from('<I', self._mm, len(SessionTrace.MAGIC))
+        self.header = json.loads(self._mm[start:start + length].decode('utf-8'))
+        offset = start + length
+        # A session that crashed may end in a partial record; it is ignored
+        count = (len(self._mm) - offset) // SessionTrace.DTYPE.itemsize
+        self.records = np.frombuffer(self._mm, dtype=SessionTrace.DTYPE, count=count, offset=offset)
+        self.templates = self.header.get('templates', [])
+        self.colors = self.header.get('colors', [])
+        self.players = self.header.get('players', [])
+
+    def of_kind(self, kind):
+        return self.records[self.records['kind'] == kind]
+
+    def template(self, code):
+        return self.templates[code] if code < len(self.templates) else '?'
+
+    def color(self, index):
+        return self.colors[index] if index < len(self.colors) else None
+
+    def player(self, index):
+        return self.players[index]['name'] if index < len(self.players) else f"#{index}"
+
+    def close(self):
+        self.records = None
+        try:
+            self._mm.close()
+        except BufferError:
+            pass  # a numpy view is still alive (e.g. in a traceback); the mapping goes with it
+        self._fh.close()
+
+
+def pct(values, q):
+    return float(np.percentile(values, q)) if len(values) else 0.0
+
+
+def summarize(trace):
+    rec = trace.records
+    started = trace.header.get('started', float(rec['t'].min()) if len(rec) else 0.0)
+    duration = float(rec['t'].max() - rec['t'].min()) if len(rec) else 0.0
+    kinds = {name: int(np.count_nonzero(rec['kind'] == int(k))) for k, name in SessionTrace.KINDS.items()}
+
+    frames = trace.of_kind(SessionTrace.FRAME)
+    gaps = np.diff(np.sort(frames['t'])) if len(frames) > 1 else np.zeros(0)
+    frame_stats = {
+        'count': len(frames),
+        'fps': len(frames) / duration if duration else 0.0,
+        'full_fraction': float(np.mean(frames['code'] & 1)) if len(frames) else 0.0,
+        'detect_ms': {'p50': pct(frames['a'], 50), 'p99': pct(frames['a'], 99),
+                      'max': float(frames['a'].max()) if len(frames) else 0.0},
+        'longest_gap_s': float(gaps.max()) if len(gaps) else 0.0,
+        'longest_gap_at_s': float(np.sort(frames['t'])[int(gaps.argmax())] - started) if len(gaps) else 0.0,
+    }
+
+    matches = trace.of_kind(SessionTrace.MATCH)
+    match_stats = {}
+    for code in np.unique(matches['code']):
+        scores = matches['a'][matches['code'] == code]
+        match_stats[trace.template(int(code))] = {'frames': len(scores), 'min_score': float(scores.min()),
+                                                   'mean_score': float(scores.mean())}
+
+    events = [{'t': float(r['t'] - started), 'template': trace.template(int(r['code'])),
+               'color': trace.color(int(r['player']))} for r in trace.of_kind(SessionTrace.EVENT)]
+
+    levels = trace.of_kind(SessionTrace.LEVEL)
+    intensity = trace.of_kind(SessionTrace.INTENSITY)
+    players = {}
+    for index in range(len(trace.players)):
+        mine = levels[levels['player'] == index]
+        ok = mine[mine['code'] == 0]
+        last = intensity[intensity['player'] == index]
+        players[trace.player(index)] = {
+            'commands': len(mine),
+            'errors': int(np.count_nonzero(mine['code'])),
+            'per_s': len(mine) / duration if duration else 0.0,
+            'round_trip_ms': {'p50': pct(ok['b'], 50), 'p99': pct(ok['b'], 99),
+                              'max': float(ok['b'].max()) if len(ok) else 0.0},
+            'vibration_events': int(np.count_nonzero(trace.of_kind(SessionTrace.VIBRATION)['player'] == index)),
+            'final_intensity': float(last['a'][-1]) if len(last) else 0.0,
+        }
+    return {'records': len(rec), 'duration_s': duration, 'kinds': kinds, 'frames': frame_stats,
+            'matches': match_stats, 'events': events, 'players': players}
+
+
+def describe(trace, r, started):
+    kind = SessionTrace.KINDS.get(int(r['kind']), '?')
+    t = f"{r['t'] - started:10.3f}s"
+    if kind == 'frame':
+        flags = ('full ' if r['code'] & 1 else 'roi  ') + ('changed ' if r['code'] & 2 else '') + ('intermission' if r['code'] & 4 else '')
+        color = trace.color(int(r['player']))
+        return f"{t} frame  detect {r['a']:.2f} ms  +1 score {r['b']:.3f}  {flags}" + (f"  color {color}" if color else '')
+    if kind == 'match':
+        return f"{t} match  {trace.template(int(r['code']))} {r['a']:.3f} at ({r['i']}, {r['j']}) {r['b']:.0f}x{r['c']:.0f}"
+    if kind == 'event':
+        color = trace.color(int(r['player']))
+        return f"{t} EVENT  {trace.template(int(r['code']))}" + (f" ({color})" if color else '')
+    if kind == 'intensity':
+        return f"{t} intensity  {trace.player(int(r['player']))} -> {r['a']:.2f} ({r['b']:+.2f})"
+    if kind == 'vibration':
+        return f"{t} vibration  {trace.player(int(r['player']))} amplitude {r['a']:.2f} for {r['b']:.1f}s"
+    if kind == 'level':
+        error = '  ERROR' if r['code'] else ''
+        return f"{t} level  {trace.player(int(r['player']))} {r['a']:.2f} ({r['b']:.1f} ms){error}"
+    if kind == 'thumb':
+        return f"{t} thumb  {r['j']} bytes"
+    return f"{t} {kind}"
+
+
+def replay(trace, start=None, end=None, kinds=None, speed=0.0, out=sys.stdout):
+    """Print the records in time order; speed > 0 paces them (1 = real time)."""
+    rec = trace.records
+    started = trace.header.get('started', float(rec['t'].min()) if len(rec) else 0.0)
+    mask = np.ones(len(rec), dtype=bool)
+    if start is not None:
+        mask &= rec['t'] >= started + start
+    if end is not None:
+        mask &= rec['t'] <= started + end
+    if kinds:
+        codes = [k for k, name in SessionTrace.KINDS.items() if name in kinds]
+        mask &= np.isin(rec['kind'], codes)
+    selected = rec[mask]
+    # Records are appended as they happen, but frame/match/event times are capture times
+    selected = selected[np.argsort(selected['t'], kind='stable')]
+    wall = time.perf_counter()
+    first = float(selected['t'][0]) if len(selected) else 0.0
+    for r in selected:
+        if speed > 0:
+            delay = (float(r['t']) - first) / speed - (time.perf_counter() - wall)
+            if delay > 0:
+                time.sleep(delay)
+        print(describe(trace, r, started), file=out)
+    return len(selected)
+
+
+def export_thumbnails(trace, directory):
+    path = trace.path + '.thumbs'
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return 0
+    os.makedirs(directory, exist_ok=True)
+    started = trace.header.get('started', 0.0)
+    thumbs = trace.of_kind(SessionTrace.THUMB)
+    with open(path, 'rb') as fh, mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        for r in thumbs:
+            name = os.path.join(directory, f"{r['t'] - started:010.3f}.jpg")
+            with open(name, 'wb') as out:
+                out.write(mm[int(r['i']):int(r['i']) + int(r['j'])])
+    return len(thumbs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarize, replay or export a DuckSense session trace.")
+    sub = parser.add_subparsers(dest='command', required=True)
+    p = sub.add_parser('summary', help="frame timing, match scores, events and per-player command stats")
+    p.add_argument('trace')
+    p.add_argument('--json', help="write the summary as JSON to this file")
+    p = sub.add_parser('replay', help="print the records in time order")
+    p.add_argument('trace')
+    p.add_argument('--from', dest='start', type=float, help="seconds since the session started")
+    p.add_argument('--to', dest='end', type=float, help="seconds since the session started")
+    p.add_argument('--kinds', help="comma separated: " + ",".join(SessionTrace.KINDS.values()))
+    p.add_argument('--speed', type=float, default=0.0, help="pace the output (1 = real time, default 0 = no pacing)")
+    p = sub.add_parser('thumbs', help="write the stored thumbnails as JPEG files")
+    p.add_argument('trace')
+    p.add_argument('directory')
+    args = parser.parse_args()
+
+    trace = TraceFile(args.trace)
+    try:
+        if args.command == 'summary':
+            report = summarize(trace)
+            fr = report['frames']
+            print(f"{report['records']} records over {report['duration_s']:.1f} s "
+                  f"({', '.join(f'{k} {n}' for k, n in report['kinds'].items() if n)})")
+            print(f"Frames: {fr['count']} ({fr['fps']:.1f}/s, {fr['full_fraction']:.0%} full), detect p50 "
+                  f"{fr['detect_ms']['p50']:.2f} / p99 {fr['detect_ms']['p99']:.2f} / max {fr['detect_ms']['max']:.2f} ms, "
+                  f"longest gap {fr['longest_gap_s']:.2f} s at {fr['longest_gap_at_s']:.1f} s")
+            for name, st in report['matches'].items():
+                print(f"  {name:<16} matched on {st['frames']} frames, score min {st['min_score']:.3f} mean {st['mean_score']:.3f}")
+            print("Events: " + (", ".join(f"{e['t']:.1f}s {e['template']}" + (f" ({e['color']})" if e['color'] else '')
+                                          for e in report['events']) or "none"))
+            for name, st in report['players'].items():
+                rt = st['round_trip_ms']
+                print(f"  {name}: {st['commands']} commands ({st['per_s']:.1f}/s, {st['errors']} errors), round trip p50 "
+                      f"{rt['p50']:.1f} / p99 {rt['p99']:.1f} / max {rt['max']:.1f} ms, {st['vibration_events']} vibration "
+                      f"events, final intensity {st['final_intensity']:.2f}")
+            if args.json:
+                with open(args.json, 'w', encoding='utf-8') as fh:
+                    json.dump(report, fh, indent=2)
+        elif args.command == 'replay':
+            kinds = [k.strip() for k in args.kinds.split(',')] if args.kinds else None
+            replay(trace, args.start, args.end, kinds, args.speed)
+        else:
+            print(f"{export_thumbnails(trace, args.directory)} thumbnails written to {args.directory}")
+    finally:
+        trace.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())